@@ -1,7 +1,8 @@
 from aframe.core.cs import *
 from aframe.core.frame import *
 from aframe.core.material import *
-from aframe.core.beam import Beam
+from aframe.core.beam import Beam, BeamGroup
 from aframe.core.sim import *
+from aframe.core.newmark import newmark, hht_alpha
 from aframe.utils.plot_pyvista import *
 from aframe.utils.meshing import *
\ No newline at end of file
@@ -0,0 +1,145 @@
+import numpy as np
+import scipy.sparse as sp
+import csdl_alpha as csdl
+from typing import List
+
+
+def element_dofs(map:List[int], element_nodes:np.ndarray=None)->np.ndarray:
+    """
+    the global degrees of freedom of every element in a beam
+    returned as a (num_elements, 12) index array
+    element_nodes holds the (start, end) beam nodes of each element,
+    consecutive nodes by default
+    """
+    nodes = np.asarray(map, dtype=int)
+    # shape: (num_nodes, 6)
+    node_dofs = nodes[:, None] + np.arange(6)
+
+    if element_nodes is None:
+        return np.hstack((node_dofs[:-1], node_dofs[1:]))
+
+    return np.hstack((node_dofs[element_nodes[:, 0]], node_dofs[element_nodes[:, 1]]))
+
+
+def sparsity_pattern(dofs:List[np.ndarray],
+                     dim:int)->tuple[np.ndarray, np.ndarray, List[np.ndarray]]:
+    """
+    find the unique (row, col) pairs touched by the element matrices
+    and the position of every element matrix entry in the
+    resulting COO data vector
+    entries on a negative (dropped) dof get the position -1
+    """
+    keys = []
+    for element_dofs in dofs:
+        # shape: (num_elements, 12, 12)
+        rows = np.broadcast_to(element_dofs[:, :, None], element_dofs.shape + (12,))
+        cols = np.broadcast_to(element_dofs[:, None, :], element_dofs.shape + (12,))
+        key = (rows * dim + cols).ravel()
+        key[((rows < 0) | (cols < 0)).ravel()] = -1
+        keys.append(key)
+
+    keys_concat = np.concatenate(keys)
+    kept = keys_concat >= 0
+    unique_keys, inverse = np.unique(keys_concat[kept], return_inverse=True)
+    rows, cols = np.divmod(unique_keys, dim)
+
+    positions = np.full(keys_concat.size, -1)
+    positions[kept] = inverse.ravel()
+
+    # split the positions back into one index array per beam
+    splits = np.cumsum([key.size for key in keys])[:-1]
+    indices = np.split(positions, splits)
+
+    return rows, cols, indices
+
+
+
+class ScatterAdd(csdl.CustomExplicitOperation):
+    """
+    sum the entries of several input variables into
+    an output of a given shape using precomputed flat indices
+    (repeated indices are accumulated, negative indices are dropped)
+    """
+    def __init__(self, indices:List[np.ndarray], shape:tuple):
+        super().__init__()
+
+        self.indices = [np.asarray(idx, dtype=int).ravel() for idx in indices]
+        self.kept = [idx >= 0 for idx in self.indices]
+        self.shape = shape
+        self.size = int(np.prod(shape))
+
+        # the derivatives are constant sparse selection matrices
+        self.jacobians = []
+        for idx, kept in zip(self.indices, self.kept):
+            n = idx.size
+            jac = sp.csc_matrix((np.ones(kept.sum()), (idx[kept], np.arange(n)[kept])), shape=(self.size, n))
+            self.jacobians.append(jac)
+
+
+    def evaluate(self, *inputs:csdl.Variable)->csdl.Variable:
+
+        for i, x in enumerate(inputs):
+            self.declare_input(f'x{i}', x)
+
+        y = self.create_output('y', self.shape)
+
+        return y
+
+
+    def compute(self, input_vals, output_vals):
+
+        y = np.zeros(self.size)
+        for i, (idx, kept) in enumerate(zip(self.indices, self.kept)):
+            x = input_vals[f'x{i}'].ravel()
+            y += np.bincount(idx[kept], weights=x[kept], minlength=self.size)
+
+        output_vals['y'] = y.reshape(self.shape)
+
+
+    def compute_derivatives(self, input_vals, output_vals, derivatives):
+
+        for i, jac in enumerate(self.jacobians):
+            derivatives['y', f'x{i}'] = jac
+
+
+
+class SparseMatVec(csdl.CustomExplicitOperation):
+    """
+    matrix-vector product with a matrix stored
+    as COO data on a fixed sparsity pattern
+    """
+    def __init__(self, rows:np.ndarray, cols:np.ndarray, shape:tuple):
+        super().__init__()
+
+        self.rows = rows
+        self.cols = cols
+        self.shape = shape
+
+
+    def evaluate(self, data:csdl.Variable, x:csdl.Variable)->csdl.Variable:
+
+        self.declare_input('data', data)
+        self.declare_input('x', x)
+
+        y = self.create_output('y', (self.shape[0],))
+
+        return y
+
+
+    def _matrix(self, data):
+        return sp.csr_matrix((data, (self.rows, self.cols)), shape=self.shape)
+
+
+    def compute(self, input_vals, output_vals):
+
+        output_vals['y'] = self._matrix(input_vals['data']) @ input_vals['x']
+
+
+    def compute_derivatives(self, input_vals, output_vals, derivatives):
+
+        nnz = self.rows.size
+        x = input_vals['x']
+
+        derivatives['y', 'data'] = sp.csc_matrix((x[self.cols], (self.rows, np.arange(nnz))),
+                                                 shape=(self.shape[0], nnz))
+        derivatives['y', 'x'] = self._matrix(input_vals['data'])
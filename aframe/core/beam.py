@@ -2,6 +2,7 @@ import numpy as np
 import aframe as af
 import csdl_alpha as csdl
 from typing import List
+from aframe.core.assembly import ScatterAdd
 
 
 class Beam:
@@ -18,19 +19,31 @@ class Beam:
         self.cs = cs
         self.z = z
         self.num_nodes = mesh.shape[0]
-        self.num_elements = self.num_nodes - 1
+        # the (start, end) nodes of each element, shape: (num_elements, 2)
+        self.element_nodes = self._element_nodes()
+        self.num_elements = self.element_nodes.shape[0]
         self.loads = None
+        self.load_cases = None
         self.extra_inertial_mass = None
         self.fixed_boundary_conditions: List[int] = []
         self.pinned_boundary_conditions: List[int] = []
+        # node: (3,) translations or (6,) translations and rotations
+        self.prescribed_displacements: dict = {}
         # map the beam nodes to the global indices
-        self.map: List[int] = []
+        self.map: np.ndarray = None
+        # the global dofs of each element, shape: (num_elements, 12)
+        self.dofs: np.ndarray = None
+        # the global dofs of each node, shape: (num_nodes, 6)
+        self.node_dofs: np.ndarray = None
         # precompute lengths
         self.lengths, self.ll, self.mm, self.nn, self.D = self._lengths(mesh)
         # beam-specific functions
         self.local_stiffness = self._local_stiffness_matrices()
         self.local_mass = self._local_mass_matrices()
         self.transforms = self._vectorized_transforms()
+        # the 3x3 rotation repeated along the diagonal of the transforms
+        self.rotations = self.transforms[:, 0:3, 0:3]
+        self.rotations_transpose = csdl.einsum(self.rotations, action='ijk->ikj')
         self.transformed_stiffness = self._transform_stiffness_matrices()
         self.transformed_mass = self._transform_mass_matrices()
 
@@ -47,6 +60,17 @@ class Beam:
             self.pinned_boundary_conditions.append(node)
 
 
+    def prescribe(self, node, displacement):
+        # a non-zero support displacement, e.g. a settlement
+        if not isinstance(displacement, csdl.Variable):
+            displacement = csdl.Variable(value=np.asarray(displacement, dtype=float))
+
+        if displacement.shape not in ((3,), (6,)):
+            raise ValueError("displacement must have shape 3 or 6")
+        
+        self.prescribed_displacements[node] = displacement
+
+
     def add_inertial_mass(self, mass, node):
         extra_mass = csdl.Variable(value=np.zeros(self.num_nodes))
         extra_mass = extra_mass.set(csdl.slice[node], mass)
@@ -56,10 +80,30 @@ class Beam:
     def add_load(self, load):
         self.loads = load
 
+
+    def add_load_cases(self, load_cases):
+        # load_cases shape: (n_cases, num_nodes, 6)
+        if len(load_cases.shape) != 3 or load_cases.shape[1:] != (self.num_nodes, 6):
+            raise ValueError("load_cases must have shape (n_cases, num_nodes, 6)")
+        
+        self.load_cases = load_cases
+
     
+    def _element_nodes(self)->np.ndarray:
+        # consecutive mesh nodes
+        nodes = np.arange(self.num_nodes)
+        return np.column_stack((nodes[:-1], nodes[1:]))
+
+
+    def _element_ends(self, mesh)->tuple[csdl.Variable, csdl.Variable]:
+        # the (num_elements, 3) start and end points of the elements
+        return mesh[:-1], mesh[1:]
+
+
     def _lengths(self, mesh)->tuple[csdl.Variable, csdl.Variable, csdl.Variable, csdl.Variable, csdl.Variable]:
         # Compute the squared differences
-        diffs = mesh[1:] - mesh[:-1]
+        start, end = self._element_ends(mesh)
+        diffs = end - start
         # Sum the squared differences along the rows and take the square root
         lengths = csdl.norm(diffs, axes=(1,))
         exl = csdl.expand(lengths, (self.num_elements, 3), action='i->ij')
@@ -84,82 +128,51 @@ class Beam:
         J = self.cs.ix
         L = self.lengths
 
-        local_stiffness = csdl.Variable(value=np.zeros((self.num_elements, 12, 12)))
-
         # pre-computations for speed
         AEL = A*E/L
         nAEL = -AEL
         GJL = G*J/L
         nGJL = -GJL
 
-        EIz = E*Iz
-        EIzL = EIz/L
+        EIzL = E*Iz/L
         EIzL2 = EIzL/L
-        EIzL3 = EIzL2/L
-        EIzL312 = 12*EIzL3
+        EIzL312 = 12*EIzL2/L
         nEIzL312 = -EIzL312
         EIzL26 = 6*EIzL2
         nEIzL26 = -EIzL26
         EIzL4 = 4*EIzL
         EIzL2 = 2*EIzL
 
-        EIy = E*Iy
-        EIyL = EIy/L
+        EIyL = E*Iy/L
         EIyL2 = EIyL/L
-        EIyL3 = EIyL2/L
+        EIyL312 = 12*EIyL2/L
+        nEIyL312 = -EIyL312
         EIyL26 = 6*EIyL2
         nEIyL26 = -EIyL26
-        EIyL312 = 12*EIyL3
-        nEIyL312 = -EIyL312
         EIyL4 = 4*EIyL
         EIyL2 = 2*EIyL
 
-        local_stiffness = local_stiffness.set(csdl.slice[:, 0, 0], AEL)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 1, 1], EIzL312)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 1, 5], EIzL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 5, 1], EIzL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 2, 2], EIyL312)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 2, 4], nEIyL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 4, 2], nEIyL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 3, 3], GJL)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 4, 4], EIyL4)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 5, 5], EIzL4)
-
-        local_stiffness = local_stiffness.set(csdl.slice[:, 0, 6], nAEL)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 1, 7], nEIzL312)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 1, 11], EIzL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 2, 8], nEIyL312)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 2, 10], nEIyL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 3, 9], nGJL)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 4, 8], EIyL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 4, 10], EIyL2)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 5, 7], nEIzL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 5, 11], EIzL2)
-
-        local_stiffness = local_stiffness.set(csdl.slice[:, 6, 0], nAEL)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 7, 1], nEIzL312)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 7, 5], nEIzL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 8, 2], nEIyL312)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 8, 4], EIyL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 9, 3], nGJL)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 10, 2], nEIyL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 10, 4], EIyL2)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 11, 1], EIzL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 11, 5], EIzL2)
-
-        local_stiffness = local_stiffness.set(csdl.slice[:, 6, 6], AEL)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 7, 7], EIzL312)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 7, 11], nEIzL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 11, 7], nEIzL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 8, 8], EIyL312)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 8, 10], EIyL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 10, 8], EIyL26)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 9, 9], GJL)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 10, 10], EIyL4)
-        local_stiffness = local_stiffness.set(csdl.slice[:, 11, 11], EIzL4)
-
-
-        return local_stiffness
+        # each coefficient and its (row, col) locations in the element matrix
+        entries = [
+            (AEL, [(0, 0), (6, 6)]),
+            (nAEL, [(0, 6), (6, 0)]),
+            (EIzL312, [(1, 1), (7, 7)]),
+            (nEIzL312, [(1, 7), (7, 1)]),
+            (EIzL26, [(1, 5), (5, 1), (1, 11), (11, 1)]),
+            (nEIzL26, [(5, 7), (7, 5), (7, 11), (11, 7)]),
+            (EIzL4, [(5, 5), (11, 11)]),
+            (EIzL2, [(5, 11), (11, 5)]),
+            (EIyL312, [(2, 2), (8, 8)]),
+            (nEIyL312, [(2, 8), (8, 2)]),
+            (EIyL26, [(4, 8), (8, 4), (8, 10), (10, 8)]),
+            (nEIyL26, [(2, 4), (4, 2), (2, 10), (10, 2)]),
+            (EIyL4, [(4, 4), (10, 10)]),
+            (EIyL2, [(4, 10), (10, 4)]),
+            (GJL, [(3, 3), (9, 9)]),
+            (nGJL, [(3, 9), (9, 3)]),
+        ]
+
+        return self._scatter_local_matrices(entries)
     
 
     def _local_mass_matrices(self)->csdl.Variable:
@@ -173,66 +186,48 @@ class Beam:
         aa = L / 2
         aa2 = aa**2
         coef = rho * A * aa / 105
-        coef70 = coef * 70
-        coef78 = coef * 78
-        coef35 = coef * 35
-        ncoef35 = -coef35
-        coef27 = coef * 27
         coef22aa = coef * 22 * aa
-        ncoef22aa = -coef22aa
         coef13aa = coef * 13 * aa
-        ncoef13aa = -coef13aa
-        coef8aa2 = coef * 8 * aa2
-        ncoef6aa2 = -coef * 6 * aa2
         rx2 = J / A
-        ncoef35rx2 = ncoef35 * rx2
-
-        local_mass = csdl.Variable(value=np.zeros((self.num_elements, 12, 12)))
-
-        local_mass = local_mass.set(csdl.slice[:, 0, 0], coef70)
-        local_mass = local_mass.set(csdl.slice[:, 1, 1], coef78)
-        local_mass = local_mass.set(csdl.slice[:, 2, 2], coef78)
-        local_mass = local_mass.set(csdl.slice[:, 3, 3], coef78 * rx2)
-        local_mass = local_mass.set(csdl.slice[:, 2, 4], ncoef22aa)
-        local_mass = local_mass.set(csdl.slice[:, 4, 2], ncoef22aa)
-        local_mass = local_mass.set(csdl.slice[:, 4, 4], coef8aa2)
-        local_mass = local_mass.set(csdl.slice[:, 1, 5], coef22aa)
-        local_mass = local_mass.set(csdl.slice[:, 5, 1], coef22aa)
-        local_mass = local_mass.set(csdl.slice[:, 5, 5], coef8aa2)
-        local_mass = local_mass.set(csdl.slice[:, 0, 6], coef35)
-        local_mass = local_mass.set(csdl.slice[:, 6, 0], coef35)
-        local_mass = local_mass.set(csdl.slice[:, 6, 6], coef70)
-        local_mass = local_mass.set(csdl.slice[:, 1, 7], coef27)
-        local_mass = local_mass.set(csdl.slice[:, 7, 1], coef27)
-        local_mass = local_mass.set(csdl.slice[:, 5, 7], coef13aa)
-        local_mass = local_mass.set(csdl.slice[:, 7, 5], coef13aa)
-        local_mass = local_mass.set(csdl.slice[:, 7, 7], coef78)
-        local_mass = local_mass.set(csdl.slice[:, 2, 8], coef27)
-        local_mass = local_mass.set(csdl.slice[:, 8, 2], coef27)
-        local_mass = local_mass.set(csdl.slice[:, 4, 8], ncoef13aa)
-        local_mass = local_mass.set(csdl.slice[:, 8, 4], ncoef13aa)
-        local_mass = local_mass.set(csdl.slice[:, 8, 8], coef78)
-        local_mass = local_mass.set(csdl.slice[:, 3, 9], ncoef35rx2)
-        local_mass = local_mass.set(csdl.slice[:, 9, 3], ncoef35rx2)
-        local_mass = local_mass.set(csdl.slice[:, 9, 9], coef70 * rx2)
-        local_mass = local_mass.set(csdl.slice[:, 2, 10], coef13aa)
-        local_mass = local_mass.set(csdl.slice[:, 10, 2], coef13aa)
-        local_mass = local_mass.set(csdl.slice[:, 4, 10], ncoef6aa2)
-        local_mass = local_mass.set(csdl.slice[:, 10, 4], ncoef6aa2)
-        local_mass = local_mass.set(csdl.slice[:, 8, 10], coef22aa)
-        local_mass = local_mass.set(csdl.slice[:, 10, 8], coef22aa)
-        local_mass = local_mass.set(csdl.slice[:, 10, 10], coef8aa2)
-        local_mass = local_mass.set(csdl.slice[:, 1, 11], ncoef13aa)
-        local_mass = local_mass.set(csdl.slice[:, 11, 1], ncoef13aa)
-        local_mass = local_mass.set(csdl.slice[:, 5, 11], ncoef6aa2)
-        local_mass = local_mass.set(csdl.slice[:, 11, 5], ncoef6aa2)
-        local_mass = local_mass.set(csdl.slice[:, 7, 11], ncoef22aa)
-        local_mass = local_mass.set(csdl.slice[:, 11, 7], ncoef22aa)
-        local_mass = local_mass.set(csdl.slice[:, 11, 11], coef8aa2)
-
-
-        return local_mass
+        coef35rx2 = coef * 35 * rx2
+
+        # each coefficient and its (row, col) locations in the element matrix
+        entries = [
+            (coef * 70, [(0, 0), (6, 6)]),
+            (coef * 35, [(0, 6), (6, 0)]),
+            (coef * 78, [(1, 1), (2, 2), (7, 7), (8, 8)]),
+            (coef * 27, [(1, 7), (7, 1), (2, 8), (8, 2)]),
+            (coef22aa, [(1, 5), (5, 1), (8, 10), (10, 8)]),
+            (-coef22aa, [(2, 4), (4, 2), (7, 11), (11, 7)]),
+            (coef13aa, [(5, 7), (7, 5), (2, 10), (10, 2)]),
+            (-coef13aa, [(4, 8), (8, 4), (1, 11), (11, 1)]),
+            (coef * 8 * aa2, [(4, 4), (5, 5), (10, 10), (11, 11)]),
+            (-coef * 6 * aa2, [(4, 10), (10, 4), (5, 11), (11, 5)]),
+            (coef * 78 * rx2, [(3, 3)]),
+            (coef * 70 * rx2, [(9, 9)]),
+            (-coef35rx2, [(3, 9), (9, 3)]),
+        ]
+
+        return self._scatter_local_matrices(entries)
+    
 
+    def _scatter_local_matrices(self, entries:list)->csdl.Variable:
+        """
+        build the (num_elements, 12, 12) element matrices from a single
+        stacked coefficient tensor and a constant sparsity pattern
+        """
+        coefficients, positions = [], []
+        for coefficient, locations in entries:
+            for i, j in locations:
+                coefficients.append(coefficient)
+                positions.append(12 * i + j)
+
+        # shape: (num_entries, num_elements)
+        stacked = csdl.vstack(coefficients)
+        indices = np.array(positions)[:, None] + 144 * np.arange(self.num_elements)
+
+        return ScatterAdd([indices], (self.num_elements, 12, 12)).evaluate(stacked)
+    
 
     def _transforms(self)->csdl.Variable:
         """
@@ -280,11 +275,33 @@ class Beam:
         a vectorized version of the transforms() method
         thanks Mark
         """
+        T = csdl.Variable(value=np.zeros((self.num_elements, 12, 12)))
+
+        (lls_concat, mms_concat, nns_concat, nmmDs_concat, 
+         llDs_concat, nnllD_concant, nnnmmD_concant, Ds_concat) = self._rotation_entries()
+
+        T = T.set(csdl.slice[:, [0,3,6,9], [0,3,6,9]], lls_concat.expand((self.num_elements, 4), action='i->ij'))
+        T = T.set(csdl.slice[:, [0,3,6,9], [1,4,7,10]], mms_concat.expand((self.num_elements, 4), action='i->ij'))
+        T = T.set(csdl.slice[:, [0,3,6,9], [2,5,8,11]], nns_concat.expand((self.num_elements, 4), action='i->ij'))
+        T = T.set(csdl.slice[:, [1,4,7,10], [0,3,6,9]], nmmDs_concat.expand((self.num_elements, 4), action='i->ij'))
+        T = T.set(csdl.slice[:, [1,4,7,10], [1,4,7,10]], llDs_concat.expand((self.num_elements, 4), action='i->ij'))
+        T = T.set(csdl.slice[:, [2,5,8,11], [0,3,6,9]], nnllD_concant.expand((self.num_elements, 4), action='i->ij'))
+        T = T.set(csdl.slice[:, [2,5,8,11], [1,4,7,10]], nnnmmD_concant.expand((self.num_elements, 4), action='i->ij'))
+        T = T.set(csdl.slice[:, [2,5,8,11], [2,5,8,11]], Ds_concat.expand((self.num_elements, 4), action='i->ij'))
+
+        self.transformations_bookshelf = T
+
+        return T
+
+
+    def _rotation_entries(self)->tuple[csdl.Variable, ...]:
+        """
+        the entries of the 3x3 rotation of each element, row by row
+        """
         ll = self.ll
         mm = self.mm
         nn = self.nn
         D = self.D
-        T = csdl.Variable(value=np.zeros((self.num_elements, 12, 12)))
 
         if self.z:
             zeros = csdl.Variable(value=np.zeros((self.num_elements,)))
@@ -307,24 +324,11 @@ class Beam:
             nnnmmD_concant = nn * nmmDs_concat
             Ds_concat = D
 
-        T = T.set(csdl.slice[:, [0,3,6,9], [0,3,6,9]], lls_concat.expand((self.num_elements, 4), action='i->ij'))
-        T = T.set(csdl.slice[:, [0,3,6,9], [1,4,7,10]], mms_concat.expand((self.num_elements, 4), action='i->ij'))
-        T = T.set(csdl.slice[:, [0,3,6,9], [2,5,8,11]], nns_concat.expand((self.num_elements, 4), action='i->ij'))
-        T = T.set(csdl.slice[:, [1,4,7,10], [0,3,6,9]], nmmDs_concat.expand((self.num_elements, 4), action='i->ij'))
-        T = T.set(csdl.slice[:, [1,4,7,10], [1,4,7,10]], llDs_concat.expand((self.num_elements, 4), action='i->ij'))
-        T = T.set(csdl.slice[:, [2,5,8,11], [0,3,6,9]], nnllD_concant.expand((self.num_elements, 4), action='i->ij'))
-        T = T.set(csdl.slice[:, [2,5,8,11], [1,4,7,10]], nnnmmD_concant.expand((self.num_elements, 4), action='i->ij'))
-        T = T.set(csdl.slice[:, [2,5,8,11], [2,5,8,11]], Ds_concat.expand((self.num_elements, 4), action='i->ij'))
-
-        self.transformations_bookshelf = T
-
-        return T
+        return (lls_concat, mms_concat, nns_concat, nmmDs_concat, 
+                llDs_concat, nnllD_concant, nnnmmD_concant, Ds_concat)
 
 
     def _transform_stiffness_matrices(self)->csdl.Variable:
-        transforms = self.transforms
-        local_stiffness_matrices = self.local_stiffness
-
         # transformed_stiffness_matrices = []
         # for i in range(self.num_elements):
         #     T = transforms[i]
@@ -332,50 +336,44 @@ class Beam:
         #     TKT = csdl.matmat(csdl.transpose(T), csdl.matmat(local_stiffness, T))
         #     transformed_stiffness_matrices.append(TKT)
 
-        # Shape: (num_elements, n, n)
-        T_transpose = csdl.einsum(transforms, action='ijk->ikj')
-        # Shape: (num_elements, n, n)
-        T_transpose_K = csdl.einsum(T_transpose, local_stiffness_matrices, action='ijk,ikl->ijl')
-        # Shape: (num_elements, n, n)
-        transformed_stiffness_matrices = csdl.einsum(T_transpose_K, transforms, action='ijk,ikl->ijl')
-
-
-        return transformed_stiffness_matrices
+        return self._rotate(self.local_stiffness)
     
 
     def _transform_mass_matrices(self)->csdl.Variable:
-        transforms = self.transforms
-        local_mass_matrices = self.local_mass
-
         # transformed_mass_matrices = []
-
         # for i in range(self.num_elements):
         #     T = transforms[i]
         #     local_mass = local_mass_matrices[i, :, :]
         #     TMT = csdl.matmat(csdl.transpose(T), csdl.matmat(local_mass, T))
         #     transformed_mass_matrices.append(TMT)
 
-        # Shape: (num_elements, n, n)
-        T_transpose = csdl.einsum(transforms, action='ijk->ikj')
-        # Shape: (num_elements, n, n)
-        T_transpose_M = csdl.einsum(T_transpose, local_mass_matrices, action='ijk,ikl->ijl')
-        # Shape: (num_elements, n, n)
-        transformed_mass_matrices = csdl.einsum(T_transpose_M, transforms, action='ijk,ikl->ijl')
+        return self._rotate(self.local_mass)
+    
 
-        return transformed_mass_matrices
+    def _rotate(self, matrices:csdl.Variable)->csdl.Variable:
+        """
+        compute T^T A T block by block, T is block diagonal with four
+        copies of the same 3x3 rotation R, so each 3x3 block of A is
+        rotated as R^T A_ab R instead of two dense 12x12 products
+        """
+        ne = self.num_elements
+        # Shape: (num_elements, 4, 3, 4, 3)
+        blocks = matrices.reshape((ne, 4, 3, 4, 3))
+        # R^T on the block rows
+        left = csdl.einsum(self.rotations_transpose, blocks, action='eij,eajbk->eaibk')
+        # R on the block columns
+        rotated = csdl.einsum(left, self.rotations, action='eaibk,ekl->eaibl')
+
+        return rotated.reshape((ne, 12, 12))
     
 
     def _recover_loads(self, U)->csdl.Variable:
 
-        map = self.map
-        displacements = csdl.Variable(value=np.zeros((self.num_elements, 12)))
         lsb = self.local_stiffness
         tb = self.transforms
 
-        for i in range(self.num_elements):
-            idxa, idxb = map[i], map[i+1]
-            displacements = displacements.set(csdl.slice[i, 0:6], U[idxa:idxa+6])
-            displacements = displacements.set(csdl.slice[i, 6:12], U[idxb:idxb+6])
+        # gather the element displacements, shape: (num_elements, 12)
+        displacements = U[self.dofs.ravel().tolist()].reshape((self.num_elements, 12))
 
         # Perform transformations
         transformed_displacements = csdl.einsum(tb, displacements, action='ijk,ik->ij')
@@ -386,19 +384,112 @@ class Beam:
         return loads
     
 
-    def _mass(self)->tuple[csdl.Variable, csdl.Variable]:
-
+    def _mass(self)->tuple[csdl.Variable, csdl.Variable, csdl.Variable]:
+        """
+        the beam mass, first moment of mass and
+        inertia tensor about the origin
+        """
         lengths = self.lengths
         rho = self.material.density
         area = self.cs.area
+        ne = self.num_elements
 
         element_masses = area * lengths * rho
         beam_mass = csdl.sum(element_masses)
 
-        rmvec = 0
-        for i in range(self.num_elements):
-            cg = (self.mesh[i + 1, :] + self.mesh[i, :]) / 2
-            rmvec += cg * element_masses[i]
+        # element midpoints, shape: (num_elements, 3)
+        start, end = self._element_ends(self.mesh)
+        midpoints = (start + end) / 2
+        rmvec = csdl.einsum(midpoints, element_masses, action='ij,i->j')
+
+        # the element masses lumped at the midpoints: sum m (r.r I - r r^T)
+        r2 = csdl.sum(midpoints**2, axes=(1,))
+        weighted_midpoints = midpoints * csdl.expand(element_masses, (ne, 3), action='i->ij')
+        point_inertia = csdl.expand(csdl.sum(element_masses * r2), (3, 3)) * np.eye(3)
+        point_inertia = point_inertia - csdl.einsum(weighted_midpoints, midpoints, action='ij,ik->jk')
+
+        # the inertia of each element about its midpoint in the local axes
+        rod = element_masses * lengths**2 / 12
+        rhoL = rho * lengths
+        local_inertia = csdl.Variable(value=np.zeros((ne, 3)))
+        local_inertia = local_inertia.set(csdl.slice[:, 0], rhoL * (self.cs.iy + self.cs.iz))
+        local_inertia = local_inertia.set(csdl.slice[:, 1], rod + rhoL * self.cs.iy)
+        local_inertia = local_inertia.set(csdl.slice[:, 2], rod + rhoL * self.cs.iz)
+
+        # rotated to the global axes and summed: sum R^T diag(I_local) R
+        R = self.rotations
+        weighted_R = R * csdl.expand(local_inertia, (ne, 3, 3), action='ij->ijk')
+        element_inertia = csdl.einsum(R, weighted_R, action='eji,ejk->ik')
+
+        return beam_mass, rmvec, point_inertia + element_inertia
+
+
+
+class BeamGroup(Beam):
+    """
+    many members with the same material and cross-section type stored
+    as one batched beam, so the element matrices of every member come
+    from a single set of vectorized operations
+
+    mesh: the (num_nodes, 3) nodes shared by all the members
+    connectivity: the (num_members, member_nodes) mesh nodes of each member,
+    e.g. from aframe.utils.meshing.truss_mesh, members sharing a node are
+    connected without any joints
+    cs: a cross-section with one value per element, the elements are
+    ordered member by member, shape: (num_members * (member_nodes - 1),)
+
+    vertical members are detected from the mesh values and get the
+    same rotation as a Beam with z=True, the mesh needs a value when
+    the element matrices are built (an inline recorder) and the
+    vertical members stay fixed if the mesh is a design variable
+    """
+    def __init__(self, name:str, 
+                 mesh:csdl.Variable, 
+                 connectivity:np.ndarray, 
+                 material:'af.Material', 
+                 cs:'af.cs'):
+        
+        self.connectivity = np.asarray(connectivity, dtype=int)
+        self.num_members, self.member_nodes = self.connectivity.shape
+        super().__init__(name, mesh, material, cs)
 
-        return beam_mass, rmvec
 
+    def _element_nodes(self)->np.ndarray:
+        # the consecutive nodes of every member
+        c = self.connectivity
+        return np.stack((c[:, :-1], c[:, 1:]), axis=-1).reshape(-1, 2)
+
+
+    def _element_ends(self, mesh)->tuple[csdl.Variable, csdl.Variable]:
+        return mesh[self.element_nodes[:, 0].tolist()], mesh[self.element_nodes[:, 1].tolist()]
+
+
+    def _rotation_entries(self)->tuple[csdl.Variable, ...]:
+        """
+        the general rotation on inclined elements, blended with
+        the z rotation on vertical elements (where D = 0)
+        """
+        ll = self.ll
+        mm = self.mm
+        nn = self.nn
+        if self.D.value is None:
+            raise ValueError("BeamGroup detects the vertical members from the mesh value, use an inline recorder")
+
+        # 1 on the vertical elements, 0 elsewhere (fixed at build time)
+        vertical = (np.abs(self.D.value) < 1E-12).astype(float)
+        inclined = 1 - vertical
+        # D = sqrt(ll^2 + mm^2) with a unit radicand on the vertical elements,
+        # so neither the divisions nor the square root derivative blow up there
+        D = (ll**2 + mm**2 + vertical)**0.5
+
+        lls_concat = ll * inclined
+        mms_concat = mm * inclined
+        nns_concat = nn
+        nmmDs_concat = -mm / D * inclined
+        llDs_concat = ll / D * inclined + vertical
+        nnllD_concant = -nn * (ll / D * inclined + vertical)
+        nnnmmD_concant = nn * nmmDs_concat
+        Ds_concat = D * inclined
+
+        return (lls_concat, mms_concat, nns_concat, nmmDs_concat, 
+                llDs_concat, nnllD_concant, nnnmmD_concant, Ds_concat)
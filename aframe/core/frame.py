@@ -1,27 +1,90 @@
 import numpy as np
 import aframe as af
-# import scipy.sparse as sp
+import scipy.sparse as sp
 # import scipy.sparse.linalg as spla
+from scipy.sparse.csgraph import reverse_cuthill_mckee
 import csdl_alpha as csdl
 from typing import List
+from aframe.core.assembly import element_dofs, sparsity_pattern, ScatterAdd, SparseMatVec
+from aframe.core.solvers import SparseSolve, BandedSolve, DenseSolve, FactorCache, ConjugateGradientSolve, EigenSolve
 
 class Frame:
-    def __init__(self):
-
+    def __init__(self, 
+                 solver:str='dense', 
+                 cache_size:int=None, 
+                 reduced:bool=False, 
+                 solver_options:dict=None):
+        """
+        solver: 'dense' assembles dense global matrices and uses csdl.solve_linear,
+        'sparse' assembles COO data on the element sparsity pattern
+        and uses a sparse LU solve,
+        'banded' assembles COO data and uses a banded Cholesky solve
+        (jointed frames are renumbered with reverse Cuthill-McKee),
+        'cg' never forms K and uses a block-Jacobi preconditioned
+        conjugate gradient solve with element-by-element products
+
+        cache_size: the number of stiffness factorizations to keep
+        in an LRU cache, so repeated evaluations with unchanged stiffness
+        skip the factorization (None disables the cache)
+
+        reduced: remove the constrained dofs from the system before
+        solving instead of zeroing their rows and columns
+
+        solver_options: keyword arguments of the 'cg' solver (tol, maxiter)
+        """
+        if solver not in ('dense', 'sparse', 'banded', 'cg'):
+            raise ValueError(f"Invalid solver: {solver}")
+        
+        if solver == 'cg' and reduced:
+            raise ValueError("the cg solver does not support the reduced system")
+
+        self.solver = solver
+        self.sparse = solver in ('sparse', 'banded')
+        self.matrix_free = solver == 'cg'
+        self.solver_options = solver_options if solver_options is not None else {}
+        # the iteration count and residual history of the cg solver
+        self.solver_info = None
+        self.factor_cache = FactorCache(cache_size) if cache_size else None
+        self.reduced = reduced
         self.beams: List[af.Beam] = []
         self.joints: List[dict] = []
         self.acc = None
         self.displacement = {}
+        self.nodal_displacement = {}
         self.cg = None
         self.mass = None
+        # the inertia tensor about the cg and the 6x6 rigid body mass matrix
+        self.inertia = None
+        self.rigid_body_mass = None
         self.residual = None
+        # the constrained global matrices/loads of the latest dynamic residual
+        # (COO data on the sparsity pattern in the sparse modes,
+        # see global_matrix for the assembled matrix)
+        self.K = None
+        self.M = None
+        self.C = None
+        self.F = None
         self.dim = None
         self.num = None
+        self.U = None
+        self.num_cases = None
+        # the sparsity pattern of the global matrices
+        self.rows = None
+        self.cols = None
+        # the constrained/free dof indices
+        self.constrained = None
+        self.free = None
+        # the dimension of the solved system
+        self.system_dim = None
+        # the free-dof sparsity pattern used by the modal analysis
+        self._modal_pattern = None
+        self.finalized = False
 
 
     def add_beam(self, beam:'af.Beam'):
 
         self.beams.append(beam)
+        self.finalized = False
 
 
     def add_joint(self, 
@@ -29,6 +92,7 @@ class Frame:
                   nodes:List[int]):
         
         self.joints.append({'members': members, 'nodes': nodes})
+        self.finalized = False
 
 
     def add_acc(self, acc:csdl.Variable):
@@ -42,58 +106,169 @@ class Frame:
             raise ValueError("acc is not None")
         
     
-    def _utils(self)->tuple[int, int]:
+    def finalize(self)->None:
+        """
+        number the nodes and dofs, merge the joints and build the
+        index arrays used by the assembly and the boundary conditions
+        this only runs once, so solve, dynamic_residual and compute_stress
+        can be called repeatedly without any setup cost
+        """
+        if self.finalized:
+            return None
 
-        idx = 0
-        for beam in self.beams:
-            beam.map.extend(range(idx, idx + beam.num_nodes))
-            idx += beam.num_nodes
+        # one block of provisional node indices per beam
+        offsets = np.cumsum([0] + [beam.num_nodes for beam in self.beams])
+        maps = [np.arange(offsets[i], offsets[i + 1]) for i in range(len(self.beams))]
+        position = {id(beam): i for i, beam in enumerate(self.beams)}
 
         # re-assign joint nodes
         for joint in self.joints:
             members = joint['members']
             nodes = joint['nodes']
-            index = members[0].map[nodes[0]]
-
-            for i, member in enumerate(members):
-                if i != 0:
-                    member.map[nodes[i]] = index
-
-        # nodes = set()
-        # for beam in self.beams:
-        #     for i in range(beam.num_nodes):
-        #         nodes.add(beam.map[i])
-        # a faster version of the above code
-        nodes = {node for beam in self.beams for node in beam.map[:beam.num_nodes]}
-        
+            index = maps[position[id(members[0])]][nodes[0]]
+
+            for member, node in zip(members[1:], nodes[1:]):
+                maps[position[id(member)]][node] = index
+
+        # compact numbering of the unique nodes
+        unique, inverse = np.unique(np.concatenate(maps), return_inverse=True)
+        maps = np.split(inverse.ravel(), offsets[1:-1])
+
         # the global dimension is the number of unique nodes times
         # the degrees of freedom per node
-        num = len(nodes)
+        num = unique.size
         dim = num * 6
 
-        helper = {node: i for i, node in enumerate(nodes)}
+        # renumber jointed frames and beam groups to keep the bandwidth small
+        grouped = any(isinstance(beam, af.BeamGroup) for beam in self.beams)
+        if self.solver == 'banded' and (self.joints or grouped):
+            edges = [map[beam.element_nodes] for beam, map in zip(self.beams, maps)]
+            new = self._reverse_cuthill_mckee(edges, num)
+            maps = [new[map] for map in maps]
 
+        for beam, map in zip(self.beams, maps):
+            beam.map = map * 6
+            # the flat element/node dof indices used by the assembly
+            beam.dofs = element_dofs(beam.map, beam.element_nodes)
+            beam.node_dofs = beam.map[:, None] + np.arange(6)
+
+        self.dim = dim
+        self.num = num
+        self.constrained = self._constrained_dofs()
+
+        # the stacked node dofs of every beam for the displacement gather
+        self._node_dofs = np.concatenate([beam.node_dofs for beam in self.beams])
+        self._node_offsets = offsets[:-1]
+        self.free = np.setdiff1d(np.arange(dim), self.constrained)
+
+        # the element dofs in the solved system, constrained dofs
+        # are dropped (-1) from the reduced system
+        if self.reduced:
+            system = np.full(dim, -1)
+            system[self.free] = np.arange(self.free.size)
+            dofs = [system[beam.dofs] for beam in self.beams]
+            self.system_dim = self.free.size
+        else:
+            dofs = [beam.dofs for beam in self.beams]
+            self.system_dim = dim
+
+        # the assembly indices
+        if self.sparse:
+            self.rows, self.cols, self._indices = sparsity_pattern(dofs, self.system_dim)
+
+            # masks to zero the constrained rows/columns of the data and put a 1 in the diagonal
+            if not self.reduced:
+                constrained = np.isin(self.rows, self.constrained) | np.isin(self.cols, self.constrained)
+                self._diagonal = (constrained & (self.rows == self.cols)).astype(float)
+                self._free = (~constrained).astype(float)
+        elif not self.matrix_free:
+            self._indices = []
+            for beam_dofs in dofs:
+                rows, cols = beam_dofs[:, :, None], beam_dofs[:, None, :]
+                indices = rows * self.system_dim + cols
+                indices[(rows < 0) | (cols < 0)] = -1
+                self._indices.append(indices.ravel())
+
+        self._modal_pattern = None
+        self.finalized = True
+
+        return None
+    
+
+    def _constrained_dofs(self)->np.ndarray:
+        """
+        the global indices of the fixed, pinned and prescribed dofs
+        """
+        indices = []
         for beam in self.beams:
             map = beam.map
-            
-            for i in range(beam.num_nodes):
-                map[i] = helper[map[i]] * 6
 
-        return dim, num
+            # the fixed boundary conditions
+            for node in beam.fixed_boundary_conditions:
+                idx = map[node]
+                for i in range(6):
+                    indices.append(idx + i)
+
+            # the pinned boundary conditions
+            for node in beam.pinned_boundary_conditions:
+                idx = map[node]
+                for i in range(3):
+                    indices.append(idx + i)
+
+            # the prescribed displacements
+            for node, displacement in beam.prescribed_displacements.items():
+                idx = map[node]
+                for i in range(displacement.shape[0]):
+                    indices.append(idx + i)
+
+        return np.unique(np.array(indices, dtype=int))
+    
+
+    def _reverse_cuthill_mckee(self, edges:List[np.ndarray], num:int)->np.ndarray:
+        """
+        reorder the node numbering with the reverse Cuthill-McKee
+        algorithm to reduce the bandwidth of the global matrices
+        returns the new index of every node
+        """
+        # the node connectivity graph from the (num_elements, 2) element nodes of each beam
+        a = np.concatenate([edge[:, 0] for edge in edges])
+        b = np.concatenate([edge[:, 1] for edge in edges])
+
+        graph = sp.csr_matrix((np.ones(a.size), (a, b)), shape=(num, num))
+        graph = graph + graph.T
+        
+        # perm[i] is the old index of the node with the new index i
+        perm = reverse_cuthill_mckee(graph, symmetric_mode=True)
+        new = np.empty(num, dtype=int)
+        new[perm] = np.arange(num)
+
+        return new
     
 
     def _mass_properties(self):
 
         # mass properties
-        mass, rmvec = 0, 0
+        mass, rmvec, inertia = 0, 0, 0
         for beam in self.beams:
-            beam_mass, beam_rmvec = beam._mass()
+            beam_mass, beam_rmvec, beam_inertia = beam._mass()
             mass += beam_mass
             rmvec += beam_rmvec
+            inertia += beam_inertia
 
-        self.cg = rmvec / mass
+        cg = rmvec / mass
+        self.cg = cg
         self.mass = mass
 
+        # parallel axis theorem: move the inertia from the origin to the cg
+        cg_outer = csdl.einsum(cg, cg, action='i,j->ij')
+        offset = csdl.expand(csdl.sum(cg**2), (3, 3)) * np.eye(3) - cg_outer
+        self.inertia = inertia - csdl.expand(mass, (3, 3)) * offset
+
+        rigid_body_mass = csdl.Variable(value=np.zeros((6, 6)))
+        rigid_body_mass = rigid_body_mass.set(csdl.slice[0:3, 0:3], csdl.expand(mass, (3, 3)) * np.eye(3))
+        rigid_body_mass = rigid_body_mass.set(csdl.slice[3:6, 3:6], self.inertia)
+        self.rigid_body_mass = rigid_body_mass
+
         return None
     
 
@@ -102,6 +277,12 @@ class Frame:
         # calculate the elemental loads and stresses
         stress = {}
         for beam in self.beams:
+            if self.num_cases is not None:
+                # shape: (n_cases, num_elements)
+                stress[beam.name] = csdl.vstack([beam.cs.stress(beam._recover_loads(self.U[i])) 
+                                                 for i in range(self.num_cases)])
+                continue
+
             # elemental loads
             element_loads = beam._recover_loads(self.U)
             # element_loads = csdl.vstack(element_loads)
@@ -115,64 +296,146 @@ class Frame:
     def _displacements(self, U:csdl.Variable)->None:
         """
         parse the global displacement vector
-        and assign the displacements to each beam
-        in the displacement dictionary
+        and assign the (num_nodes, 3) translations and
+        (num_nodes, 6) translations and rotations of each beam
+        to the displacement/nodal_displacement dictionaries
+        (with a leading n_cases axis for load cases)
         """
+        displacement, nodal_displacement = self._parse_displacements(U)
+        self.displacement.update(displacement)
+        self.nodal_displacement.update(nodal_displacement)
 
-        # find the displacements
-        for beam in self.beams:
-            self.displacement[beam.name] = csdl.Variable(value=np.zeros((beam.num_nodes, 3)))
-            map = beam.map
+        return None
+    
 
-            map_u_to_d_x, map_u_to_d_y, map_u_to_d_z = [], [], []
-            for i in range(beam.num_nodes):
-                idx = map[i]
-                map_u_to_d_x.append(idx)
-                map_u_to_d_y.append(idx + 1)
-                map_u_to_d_z.append(idx + 2)
-                # extract the (x, y, z) nodal displacement
-                # displacement[beam.name] = displacement[beam.name].set(csdl.slice[i, :], U[idx:idx+3])
+    def _parse_displacements(self, U:csdl.Variable)->tuple[dict, dict]:
+        """
+        split a (dim,) or (n, dim) global vector into the
+        per-beam translations and translations/rotations
+        """
+        # gather every beam node at once, shape: (..., total_nodes, 6)
+        idx = self._node_dofs.ravel().tolist()
+        total = self._node_dofs.shape[0]
 
-            reshaped_U = csdl.transpose(csdl.vstack([U[map_u_to_d_x], U[map_u_to_d_y], U[map_u_to_d_z]]))
-            self.displacement[beam.name] = self.displacement[beam.name].set(csdl.slice[:, :], reshaped_U)
+        if len(U.shape) == 2:
+            nodal = U[:, idx].reshape((U.shape[0], total, 6))
+        else:
+            nodal = U[idx].reshape((total, 6))
 
-        return None
+        displacement, nodal_displacement = {}, {}
+        for beam, start in zip(self.beams, self._node_offsets):
+            stop = start + beam.num_nodes
+
+            if len(U.shape) == 2:
+                nodal_displacement[beam.name] = nodal[:, start:stop, :]
+                displacement[beam.name] = nodal[:, start:stop, 0:3]
+            else:
+                nodal_displacement[beam.name] = nodal[start:stop, :]
+                displacement[beam.name] = nodal[start:stop, 0:3]
+
+        return displacement, nodal_displacement
     
 
     def _global_matrices(self)->tuple[csdl.Variable, csdl.Variable]:
         """
         create the global stiffness/mass matrices
+        (None in the matrix-free mode)
         """
+        if self.matrix_free:
+            return None, None
+        
+        if self.sparse:
+            return self._sparse_global_matrices()
 
-        K = csdl.Variable(value=np.zeros((self.dim, self.dim)))
-        M = csdl.Variable(value=np.zeros((self.dim, self.dim)))
+        # add the elemental stiffness/mass matrices to their locations in the
+        # global stiffness/mass matrix with a single scatter-add per matrix
+        dim = self.system_dim
+        indices = self._indices
 
-        for beam in self.beams:
-            transformed_stiffness_matrices = beam.transformed_stiffness
-            transformed_mass_matrices = beam.transformed_mass
-            # add the elemental stiffness/mass matrices to their locations in the 
-            # global stiffness/mass matrix
-            map = beam.map
+        K = ScatterAdd(indices, (dim, dim)).evaluate(*[beam.transformed_stiffness for beam in self.beams])
+        M = ScatterAdd(indices, (dim, dim)).evaluate(*[beam.transformed_mass for beam in self.beams])
 
-            for i in range(beam.num_elements):
-            # for i, idxa, idxb in csdl.frange(vals = (list(range(beam.num_elements)), map[:-1], map[1:])):
-                stiffness = transformed_stiffness_matrices[i]
-                mass_matrix = transformed_mass_matrices[i]
-                idxa, idxb = map[i], map[i+1]
+        return K, M
+    
 
-                K = K.set(csdl.slice[idxa:idxa+6, idxa:idxa+6], K[idxa:idxa+6, idxa:idxa+6] + stiffness[:6, :6])
-                K = K.set(csdl.slice[idxa:idxa+6, idxb:idxb+6], K[idxa:idxa+6, idxb:idxb+6] + stiffness[:6, 6:])
-                K = K.set(csdl.slice[idxb:idxb+6, idxa:idxa+6], K[idxb:idxb+6, idxa:idxa+6] + stiffness[6:, :6])
-                K = K.set(csdl.slice[idxb:idxb+6, idxb:idxb+6], K[idxb:idxb+6, idxb:idxb+6] + stiffness[6:, 6:])
+    def _sparse_global_matrices(self)->tuple[csdl.Variable, csdl.Variable]:
+        """
+        create the global stiffness/mass matrices as COO data
+        on the sparsity pattern of the element matrices
+        """
+        indices = self._indices
+        nnz = self.rows.size
 
-                M = M.set(csdl.slice[idxa:idxa+6, idxa:idxa+6], M[idxa:idxa+6, idxa:idxa+6] + mass_matrix[:6, :6])
-                M = M.set(csdl.slice[idxa:idxa+6, idxb:idxb+6], M[idxa:idxa+6, idxb:idxb+6] + mass_matrix[:6, 6:])
-                M = M.set(csdl.slice[idxb:idxb+6, idxa:idxa+6], M[idxb:idxb+6, idxa:idxa+6] + mass_matrix[6:, :6])
-                M = M.set(csdl.slice[idxb:idxb+6, idxb:idxb+6], M[idxb:idxb+6, idxb:idxb+6] + mass_matrix[6:, 6:])
+        # sum every elemental stiffness/mass matrix into the data vectors
+        K = ScatterAdd(indices, (nnz,)).evaluate(*[beam.transformed_stiffness for beam in self.beams])
+        M = ScatterAdd(indices, (nnz,)).evaluate(*[beam.transformed_mass for beam in self.beams])
 
         return K, M
     
 
+    def global_matrix(self, A:csdl.Variable)->sp.csr_matrix:
+        """
+        the value of a global matrix (e.g. self.K after dynamic_residual)
+        as a (dim, dim) sparse matrix, the sparse modes store it as
+        COO data on the sparsity pattern
+        """
+        if self.sparse:
+            return sp.csr_matrix((A.value, (self.rows, self.cols)), shape=(self.system_dim, self.system_dim))
+
+        return sp.csr_matrix(A.value)
+    
+
+    def _matvec(self, A:csdl.Variable, x:csdl.Variable)->csdl.Variable:
+        """
+        multiply a global matrix by a vector
+        """
+        if self.sparse:
+            return SparseMatVec(self.rows, self.cols, (self.system_dim, self.system_dim)).evaluate(A, x)
+
+        return csdl.matvec(A, x)
+    
+
+    def _element_matvec(self, matrices:List[csdl.Variable], x:csdl.Variable)->csdl.Variable:
+        """
+        multiply the unconstrained global matrix assembled from the
+        (num_elements, 12, 12) element matrices of each beam by a vector
+        without forming the global matrix
+        """
+        products = []
+        for beam, matrix in zip(self.beams, matrices):
+            element_x = x[beam.dofs.ravel().tolist()].reshape((beam.num_elements, 12))
+            products.append(csdl.einsum(matrix, element_x, action='ijk,ik->ij'))
+
+        return ScatterAdd([beam.dofs for beam in self.beams], (self.dim,)).evaluate(*products)
+    
+
+    def _prescribed_displacements(self)->csdl.Variable:
+        """
+        the global vector of prescribed displacements
+        (None if no displacements are prescribed)
+        """
+        indices, displacements = [], []
+        for beam in self.beams:
+            for node, displacement in beam.prescribed_displacements.items():
+                indices.append(beam.map[node] + np.arange(displacement.shape[0]))
+                displacements.append(displacement)
+
+        if not displacements:
+            return None
+
+        return ScatterAdd(indices, (self.dim,)).evaluate(*displacements)
+    
+
+    def _expand_cases(self, x:csdl.Variable)->csdl.Variable:
+        """
+        repeat a global vector for every load case
+        """
+        if self.num_cases is None:
+            return x
+        
+        return csdl.expand(x, (self.num_cases, self.dim), action='i->ji')
+    
+
     def _global_loads(self, 
                       M:csdl.Variable)->csdl.Variable:
         """
@@ -181,41 +444,59 @@ class Frame:
         and adding any inertial loads
         """
 
-        # assemble the global loads vector
-        F = csdl.Variable(value=np.zeros((self.dim)))
-        for beam in self.beams:
-            loads = beam.loads # shape: (n, 6)
-            map = beam.map # shape: (n,)
-
-            if loads is not None:
-
-                for i in range(beam.num_nodes):
-                    idx = map[i]
-                    F = F.set(csdl.slice[idx:idx+6], F[idx:idx+6] + loads[i, :])
+        # assemble the global loads vector with one scatter-add
+        beams = [beam for beam in self.beams if beam.loads is not None]
+        if beams:
+            F = ScatterAdd([beam.node_dofs for beam in beams], (self.dim,)).evaluate(*[beam.loads for beam in beams])
+        else:
+            F = csdl.Variable(value=np.zeros((self.dim)))
 
         
         # add any inertial loads
         acc = self.acc
         if acc is not None:
             expanded_acc = csdl.expand(acc, (self.num, 6), action='i->ji').flatten()
-            primary_inertial_loads = csdl.matvec(M, expanded_acc)
+            if self.reduced or self.matrix_free:
+                # the reduced mass matrix is missing the constrained rows/columns
+                transformed_mass = [beam.transformed_mass for beam in self.beams]
+                primary_inertial_loads = self._element_matvec(transformed_mass, expanded_acc)
+            else:
+                primary_inertial_loads = self._matvec(M, expanded_acc)
             F += primary_inertial_loads
 
             # added inertial masses are resolved as loads
-            for beam in self.beams:
-                # if the beam has extra inertial mass
-                if beam.extra_inertial_mass is not None:
-                    extra_mass = beam.extra_inertial_mass
-                    extra_inertial_loads = csdl.outer(extra_mass, acc)
-                    map = beam.map
-
-                    for i in range(beam.num_nodes):
-                        idx = map[i]
-                        F = F.set(csdl.slice[idx:idx+6], F[idx:idx+6] + extra_inertial_loads[i, :])
+            beams = [beam for beam in self.beams if beam.extra_inertial_mass is not None]
+            if beams:
+                extra_inertial_loads = [csdl.outer(beam.extra_inertial_mass, acc) for beam in beams]
+                F = F + ScatterAdd([beam.node_dofs for beam in beams], (self.dim,)).evaluate(*extra_inertial_loads)
+
+        # stack the load cases, the loads above are shared by every case
+        self.num_cases = self._num_cases()
+        if self.num_cases is not None:
+            shape = (self.num_cases, self.dim)
+            offsets = np.arange(self.num_cases)[:, None] * self.dim
+
+            beams = [beam for beam in self.beams if beam.load_cases is not None]
+            indices = [(offsets + beam.node_dofs.ravel()).ravel() for beam in beams]
+            F_cases = ScatterAdd(indices, shape).evaluate(*[beam.load_cases for beam in beams])
+            F = F_cases + csdl.expand(F, shape, action='i->ji')
 
         return F
     
 
+    def _num_cases(self)->int:
+        """
+        the number of load cases registered on the beams
+        (None if no beam has load cases)
+        """
+        num_cases = {beam.load_cases.shape[0] for beam in self.beams if beam.load_cases is not None}
+
+        if len(num_cases) > 1:
+            raise ValueError("all beams must have the same number of load cases")
+        
+        return num_cases.pop() if num_cases else None
+    
+
     def _boundary_conditions(self, 
                              K:csdl.Variable, 
                              M:csdl.Variable, 
@@ -227,21 +508,30 @@ class Frame:
         and putting 1s in the diagonal
         """
         # apply boundary conditions
-        indices = []
-        for beam in self.beams:
-            map = beam.map
+        indices = self.constrained.tolist()
 
-            # the fixed boundary conditions
-            for node in beam.fixed_boundary_conditions:
-                idx = map[node]
-                for i in range(6):
-                    indices.append(idx + i)
+        # move the prescribed displacements to the right-hand side
+        U_c = self._prescribed_displacements()
+        if U_c is not None:
+            if self.matrix_free:
+                transformed_stiffness = [beam.transformed_stiffness for beam in self.beams]
+                F = F - self._expand_cases(self._element_matvec(transformed_stiffness, U_c))
+            else:
+                F = F - self._expand_cases(self._matvec(K, U_c))
 
-            # the pinned boundary conditions
-            for node in beam.pinned_boundary_conditions:
-                idx = map[node]
-                for i in range(3):
-                    indices.append(idx + i)
+        if self.matrix_free:
+            # the cg solver applies the boundary conditions to K itself
+            F = self._zero_loads(F, indices, U_c)
+
+            return K, M, F
+
+        if self.sparse:
+            # zero the constrained rows/columns of the data and put a 1 in the diagonal
+            K = K * self._free + self._diagonal
+            M = M * self._free + self._diagonal
+            F = self._zero_loads(F, indices, U_c)
+
+            return K, M, F
 
         # zero the row/column then put a 1 in the diagonal
         K = K.set(csdl.slice[indices, :], 0)
@@ -252,11 +542,58 @@ class Frame:
         M = M.set(csdl.slice[:, indices], 0)
         M = M.set(csdl.slice[indices, indices], 1)
         # zero the corresponding load index as well
-        F = F.set(csdl.slice[indices], 0)
+        F = self._zero_loads(F, indices, U_c)
 
         return K, M, F
     
 
+    def _zero_loads(self, 
+                    F:csdl.Variable, 
+                    indices:List[int], 
+                    U_c:csdl.Variable=None)->csdl.Variable:
+        """
+        zero the constrained loads, or set them to the
+        prescribed displacements so the unit diagonal reproduces them
+        """
+        if len(F.shape) == 2:
+            F = F.set(csdl.slice[:, indices], 0)
+        else:
+            F = F.set(csdl.slice[indices], 0)
+
+        if U_c is not None:
+            F = F + self._expand_cases(U_c)
+        
+        return F
+    
+
+    def _reduced_solve(self, K:csdl.Variable, F:csdl.Variable)->csdl.Variable:
+        """
+        solve the system with the constrained dofs removed
+        and scatter the solution back to the global dofs
+        """
+        free = self.free.tolist()
+        shape = F.shape
+
+        # move the prescribed displacements to the right-hand side
+        U_c = self._prescribed_displacements()
+        if U_c is not None:
+            transformed_stiffness = [beam.transformed_stiffness for beam in self.beams]
+            F = F - self._expand_cases(self._element_matvec(transformed_stiffness, U_c))
+
+        if self.num_cases is None:
+            U_f = self._solve_linear(K, F[free])
+            indices = self.free
+        else:
+            U_f = self._solve_linear(K, F[:, free])
+            indices = np.arange(self.num_cases)[:, None] * self.dim + self.free
+
+        U = ScatterAdd([indices], shape).evaluate(U_f)
+        if U_c is not None:
+            U = U + self._expand_cases(U_c)
+
+        return U
+    
+
     def dynamic_residual(self, 
                          U:csdl.Variable, 
                          U_dot:csdl.Variable, 
@@ -265,30 +602,36 @@ class Frame:
         """
         a function for Andrew Fletcher
         """
-        # helper functions
-        dim, num = self._utils()
-        self.dim = dim
-        self.num = num
+        if self.reduced or self.matrix_free:
+            raise ValueError("the dynamic residual needs the full assembled matrices")
+
+        # number the nodes and dofs (only runs once)
+        self.finalize()
 
         # calculate the mass properties
-        self._mass_properties()
+        if self.mass is None:
+            self._mass_properties()
         
         # create the global stiffness/mass matrices
         K, M = self._global_matrices()
 
         # assemble the global loads vector
         F = self._global_loads(M)
+        if self.num_cases is not None:
+            raise ValueError("load cases are not supported by the dynamic residual")
 
         # apply boundary conditions
         K, M, F = self._boundary_conditions(K, M, F)
 
         if damp: C = self._rayleigh_damping(K, M)
-        else: C = csdl.Variable(value=np.zeros((self.dim, self.dim)))
+        else: C = csdl.Variable(value=np.zeros(K.shape))
 
-        R = csdl.matvec(K, U) + csdl.matvec(C, U_dot) + csdl.matvec(M, U_dotdot) - F
+        R = self._matvec(K, U) + self._matvec(C, U_dot) + self._matvec(M, U_dotdot) - F
         self.residual = R
+        self.K, self.M, self.C, self.F = K, M, C, F
 
         # find the displacements
+        self.U = U
         self._displacements(U)
 
         return R
@@ -308,10 +651,8 @@ class Frame:
         solve the system of equations
         """
 
-        # helper functions
-        dim, num = self._utils()
-        self.dim = dim
-        self.num = num
+        # number the nodes and dofs (only runs once)
+        self.finalize()
 
         # calculate the mass properties
         if self.mass is None:
@@ -323,14 +664,80 @@ class Frame:
         # assemble the global loads vector
         F = self._global_loads(M)
 
-        # apply boundary conditions
-        K, M, F = self._boundary_conditions(K, M, F)
-
         # solve the system of equations
-        U = csdl.solve_linear(K, F)
+        if self.reduced:
+            U = self._reduced_solve(K, F)
+        else:
+            # apply boundary conditions
+            K, M, F = self._boundary_conditions(K, M, F)
+            U = self._solve_linear(K, F)
 
         # find the displacements
+        self.U = U
         self._displacements(U)
 
 
-        return None
\ No newline at end of file
+        return None
+    
+
+    def modes(self, n_modes:int, sigma:float=0.)->tuple[csdl.Variable, dict[csdl.Variable]]:
+        """
+        the natural frequencies (Hz) and mode shapes of the
+        n_modes lowest modes of the constrained frame
+        the eigenproblem is solved on the sparse free-dof system
+        with shift-invert Lanczos iterations about sigma,
+        independent of the selected solver
+        the mode shapes are mass normalized with the same layout as
+        frame.displacement, shape: (n_modes, num_nodes, 3) per beam
+        only the frequencies carry derivatives
+        """
+        # number the nodes and dofs (only runs once)
+        self.finalize()
+
+        # the pattern of the system with the constrained dofs removed
+        if self._modal_pattern is None:
+            system = np.full(self.dim, -1)
+            system[self.free] = np.arange(self.free.size)
+            dofs = [system[beam.dofs] for beam in self.beams]
+            self._modal_pattern = sparsity_pattern(dofs, self.free.size)
+
+        rows, cols, indices = self._modal_pattern
+        nnz = rows.size
+
+        K = ScatterAdd(indices, (nnz,)).evaluate(*[beam.transformed_stiffness for beam in self.beams])
+        M = ScatterAdd(indices, (nnz,)).evaluate(*[beam.transformed_mass for beam in self.beams])
+
+        eigenvalues, eigenvectors = EigenSolve(rows, cols, self.free.size, n_modes, sigma).evaluate(K, M)
+        frequencies = csdl.sqrt(eigenvalues) / (2 * np.pi)
+
+        # scatter the free dofs back to the global dofs
+        offsets = np.arange(n_modes)[:, None] * self.dim
+        shapes = ScatterAdd([offsets + self.free], (n_modes, self.dim)).evaluate(eigenvectors)
+        mode_shapes, _ = self._parse_displacements(shapes)
+
+        return frequencies, mode_shapes
+    
+
+    def _solve_linear(self, K:csdl.Variable, F:csdl.Variable)->csdl.Variable:
+        """
+        solve K U = F with the selected solver
+        """
+        cache = self.factor_cache
+        dim = self.system_dim
+
+        if self.matrix_free:
+            dofs = [beam.dofs for beam in self.beams]
+            operation = ConjugateGradientSolve(dofs, dim, self.constrained, **self.solver_options)
+            self.solver_info = operation.info
+            return operation.evaluate(F, *[beam.transformed_stiffness for beam in self.beams])
+
+        if self.solver == 'sparse':
+            return SparseSolve(self.rows, self.cols, dim, cache).evaluate(K, F)
+        elif self.solver == 'banded':
+            return BandedSolve(self.rows, self.cols, dim, cache).evaluate(K, F)
+        elif self.num_cases is not None or cache is not None:
+            # factor once for every load case, the derivatives are
+            # adjoint back-substitutions with the same factorization
+            return DenseSolve(dim, cache).evaluate(K, F)
+        
+        return csdl.solve_linear(K, F)
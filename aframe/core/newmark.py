@@ -0,0 +1,119 @@
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import scipy.linalg as sla
+
+
+def hht_alpha(M, K, C, f, u0, v0, t, alpha=-0.05):
+    """
+    Solves M u'' + C u' + K u = f(t) with the Hilber-Hughes-Taylor alpha method.
+    The effective stiffness is factored once, every time step is a
+    single back-substitution.
+
+    Parameters:
+    M, K, C : np.array or scipy.sparse matrix
+        The (nu, nu) mass, stiffness and damping matrices
+        (C may be None for an undamped system).
+    f : function
+        The time-varying loads, f(t) returns an (nu,) array.
+    u0, v0 : np.array
+        The initial displacements and velocities.
+    t : np.array
+        The uniformly spaced time points where the solution is computed.
+    alpha : float
+        The numerical damping in [-1/3, 0], alpha = 0 is the
+        trapezoidal (average acceleration) rule.
+        The method is second order accurate and unconditionally stable.
+
+    Returns:
+    u, v, a : np.array
+        The (n, nu) displacements, velocities and accelerations at each time point.
+    """
+    if not -1/3 <= alpha <= 0:
+        raise ValueError("alpha must be in [-1/3, 0]")
+
+    beta = (1 - alpha)**2 / 4
+    gamma = (1 - 2 * alpha) / 2
+
+    return _integrate(M, K, C, f, u0, v0, t, beta, gamma, alpha)
+
+
+def newmark(M, K, C, f, u0, v0, t, beta=0.25, gamma=0.5):
+    """
+    Solves M u'' + C u' + K u = f(t) with the Newmark-beta method.
+    The effective stiffness K + gamma/(beta dt) C + 1/(beta dt^2) M is
+    factored once, every time step is a single back-substitution.
+
+    Parameters:
+    M, K, C : np.array or scipy.sparse matrix
+        The (nu, nu) mass, stiffness and damping matrices
+        (C may be None for an undamped system).
+    f : function
+        The time-varying loads, f(t) returns an (nu,) array.
+    u0, v0 : np.array
+        The initial displacements and velocities.
+    t : np.array
+        The uniformly spaced time points where the solution is computed.
+    beta, gamma : float
+        The Newmark parameters, the default average acceleration rule
+        is second order accurate and unconditionally stable.
+
+    Returns:
+    u, v, a : np.array
+        The (n, nu) displacements, velocities and accelerations at each time point.
+    """
+    return _integrate(M, K, C, f, u0, v0, t, beta, gamma, 0)
+
+
+def _factor(A):
+    """
+    factor A once and return a function solving A x = b
+    """
+    if sp.issparse(A):
+        return spla.splu(sp.csc_matrix(A)).solve
+
+    factor = sla.lu_factor(A)
+    return lambda b: sla.lu_solve(factor, b)
+
+
+def _integrate(M, K, C, f, u0, v0, t, beta, gamma, alpha):
+
+    t = np.asarray(t)
+    dt = t[1] - t[0]
+    if not np.allclose(np.diff(t), dt):
+        raise ValueError("the time points must be uniformly spaced")
+
+    if C is None:
+        C = 0 * K
+
+    n = len(t)
+    nu = len(u0)
+    u = np.zeros((n, nu))
+    v = np.zeros((n, nu))
+    a = np.zeros((n, nu))
+    u[0], v[0] = u0, v0
+
+    # the initial accelerations from the equations of motion
+    F_old = f(t[0])
+    a[0] = _factor(M)(F_old - C @ v[0] - K @ u[0])
+
+    # the effective stiffness, constant for a constant time step
+    c_m = 1 / (beta * dt**2)
+    c_c = gamma / (beta * dt)
+    solve = _factor(c_m * M + (1 + alpha) * c_c * C + (1 + alpha) * K)
+
+    for i in range(1, n):
+        # the predictors
+        u_p = u[i-1] + dt * v[i-1] + dt**2 * (0.5 - beta) * a[i-1]
+        v_p = v[i-1] + dt * (1 - gamma) * a[i-1]
+
+        F = f(t[i])
+        rhs = (1 + alpha) * F - alpha * F_old + alpha * (C @ v[i-1] + K @ u[i-1])
+        rhs += c_m * (M @ u_p) + (1 + alpha) * (C @ (c_c * u_p - v_p))
+
+        u[i] = solve(rhs)
+        a[i] = c_m * (u[i] - u_p)
+        v[i] = v_p + gamma * dt * a[i]
+        F_old = F
+
+    return u, v, a
@@ -1,32 +1,144 @@
 import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 import aframe as af
 from scipy.integrate import solve_ivp
+from scipy.linalg import eigh, cho_factor, cho_solve
+from scipy.sparse import csr_matrix, diags, identity, bmat
+from scipy.sparse.linalg import eigsh
 import csdl_alpha as csdl
 
 
 class Simulation:
 
-    def __init__(self, solution, start, stop, nt):
+    def __init__(self, solution, start, stop, nt, n_modes=None):
+        """
+        integrate M u_ddot + K u = F cos(900 t) from start to stop
+        the state is [u, u_dot], u0 may hold u only or the full state
 
-        self.M = solution.M.value
-        self.K = solution.K.value
+        n_modes: project the system onto its first n_modes mass-normalized
+        modes and integrate the (diagonal) modal equations instead,
+        the physical displacements are only reconstructed at the nt output times
+
+        solution may also be a Frame after dynamic_residual, the sparse
+        modes store K and M as COO data on solution.rows/cols, and u0
+        defaults to zeros when the solution has none
+        """
         self.F = solution.F.value
-        self.u0 = solution.u0.value
-        self.nu = len(self.u0)
+        self.nu = self.F.shape[0]
+        self.M = self._matrix(solution, solution.M)
+        self.K = self._matrix(solution, solution.K)
+        u0 = solution.u0.value if getattr(solution, 'u0', None) is not None else np.zeros(self.nu)
+        self.u0 = u0 if len(u0) == 2 * self.nu else np.concatenate((u0, np.zeros(self.nu)))
         self.start = start
         self.stop = stop
         self.nt = nt
-        self.index = solution.index
-        self.node_dictionary = solution.node_dictionary
+        self.index = getattr(solution, 'index', None)
+        self.node_dictionary = getattr(solution, 'node_dictionary', None)
+        # the translational dof indices of each beam, built on first use
+        self._beam_dofs = {}
+        self.n_modes = n_modes
+        # the modal coordinates [q, q_dot] at the output times
+        self.q = None
+
+        if n_modes is not None:
+            self._modal_basis(solution)
+        else:
+            self._factor_mass()
+
+    def _matrix(self, solution, A):
+        # a sparse (nu, nu) matrix from a dense value or COO data on the sparsity pattern
+        value = A.value
+        if value.ndim == 1:
+            return csr_matrix((value, (solution.rows, solution.cols)), shape=(self.nu, self.nu))
+
+        return csr_matrix(value)
+
+    def _factor_mass(self):
+        # factor M once and apply it in the ode right-hand side instead of forming M^-1 K,
+        # a lumped (diagonal) M is inverted directly and keeps the jacobian as sparse as K
+        mass = self.M.diagonal()
+        if (self.M - diags(mass)).count_nonzero() == 0:
+            self._solve_mass = lambda b: b / mass
+            MinvK = diags(1 / mass) @ self.K
+        else:
+            factor = cho_factor(self.M.toarray())
+            self._solve_mass = lambda b: cho_solve(factor, b)
+            # the implicit integrator needs M^-1 K, it is only stored as a jacobian block
+            MinvK = csr_matrix(cho_solve(factor, self.K.toarray()))
+
+        # the constant sparse jacobian of the linear ode, [[0, I], [-M^-1 K, 0]]
+        self.jac = bmat([[None, identity(self.nu)], [-MinvK, None]], format='csc')
+
+    def _modal_basis(self, solution):
+        # the constrained dofs have a unit diagonal and an empty row in K and M,
+        # they are left out so they do not show up as spurious unit modes
+        free = getattr(solution, 'free', None)
+        if free is None:
+            K_off = csr_matrix(self.K - diags(self.K.diagonal()))
+            K_off.eliminate_zeros()
+            free = np.where((np.diff(K_off.indptr) > 0) | (self.K.diagonal() != 1))[0]
+        self.free = free
+
+        K_ff = self.K[free][:, free].tocsc()
+        M_ff = self.M[free][:, free].tocsc()
+        if self.n_modes < free.size - 1:
+            # shift-invert about zero, only the lowest n_modes modes are computed
+            omega_sq, phi_f = eigsh(K_ff, self.n_modes, M_ff, sigma=0, which='LM')
+            order = np.argsort(omega_sq)
+            omega_sq, phi_f = omega_sq[order], phi_f[:, order]
+            phi_f = phi_f / np.sqrt(np.sum(phi_f * (M_ff @ phi_f), axis=0))
+        else:
+            # eigsh needs fewer modes than dofs, small systems are solved densely
+            omega_sq, phi_f = eigh(K_ff.toarray(), M_ff.toarray(), subset_by_index=[0, self.n_modes - 1])
+
+        # mass-normalized mode shapes on the global dofs, shape: (nu, n_modes)
+        self.phi = np.zeros((self.nu, self.n_modes))
+        self.phi[free] = phi_f
+        self.omega_sq = omega_sq
+        self.modal_F = self.phi.T @ self.F
+
+        # the constant jacobian of the modal ode, [[0, I], [-diag(omega^2), 0]]
+        self.jac = bmat([[None, identity(self.n_modes)], [-diags(omega_sq), None]], format='csc')
+
+        # project the initial state, q = phi^T M u
+        u0, u_dot0 = self.u0[0:self.nu], self.u0[self.nu:]
+        self.q0 = np.concatenate((self.phi.T @ (self.M @ u0), self.phi.T @ (self.M @ u_dot0)))
 
     def _ode(self, t, y):
         u = y[0:self.nu]
-        u_dot = y[self.nu:-1]
-        u_ddot = np.linalg.solve(self.M, self.F*np.cos(900*t) - self.K @ u)
-        # u_ddot = np.linalg.solve(self.M, self.F - self.K @ u)
+        u_dot = y[self.nu:]
+        u_ddot = self._solve_mass(self.F*np.cos(900*t) - self.K @ u)
+        # u_ddot = self._solve_mass(self.F - self.K @ u)
         return np.concatenate((u_dot, u_ddot))
 
+    def _modal_ode(self, t, y):
+        q = y[0:self.n_modes]
+        q_dot = y[self.n_modes:]
+        q_ddot = self.modal_F*np.cos(900*t) - self.omega_sq * q
+        return np.concatenate((q_dot, q_ddot))
+
+    def _integrate(self, t_span, y0, t_eval):
+        # integrate the full or modal ode and return the states at t_eval
+        if self.n_modes is not None:
+            sol = solve_ivp(self._modal_ode, t_span, y0, t_eval=t_eval, method='Radau', jac=self.jac)
+        else:
+            sol = solve_ivp(self._ode, t_span, y0, t_eval=t_eval, method='Radau', jac=self.jac)
+            # 'LSODA' works well also
+
+        return sol.y
+
+    def _displacements(self, y):
+        # the physical displacements, reconstructed from the modes if reduced
+        if self.n_modes is not None:
+            return self.phi @ y[0:self.n_modes]
+
+        return y[0:self.nu]
+
+    def _y0(self):
+        return self.q0 if self.n_modes is not None else self.u0
+
     def solve(self):
         # start and end time
         t_span = (self.start, self.stop)
@@ -34,88 +146,231 @@ class Simulation:
         t_eval = np.linspace(t_span[0], t_span[1], self.nt)
 
         # solve the ode
-        sol = solve_ivp(self._ode, t_span, self.u0, t_eval=t_eval, method='Radau') 
-        # 'LSODA' works well also
+        y = self._integrate(t_span, self._y0(), t_eval)
+        if self.n_modes is not None:
+            self.q = y
 
-        t = sol.t
-        u = sol.y[0:self.nu]
+        # reconstruct the displacements at the output times only
+        u = self._displacements(y)
 
-        return t, u
+        return t_eval, u
     
+    def stream(self, chunk_size=100, decimate=1, beams=None):
+        """
+        integrate chunk by chunk and yield (t, u) for each chunk,
+        t has shape (n,) and u (nu, n), or a {beam.name: (num_nodes, 3, n)}
+        dictionary of deformed meshes if beams are given
+        only every decimate-th of the nt output times is kept,
+        so the memory use does not grow with the number of time steps
+        """
+        t_out = np.linspace(self.start, self.stop, self.nt)[::decimate]
+
+        y0 = self._y0()
+        t0 = self.start
+        for i in range(0, len(t_out), chunk_size):
+            t_chunk = t_out[i:i + chunk_size]
+            if t_chunk[-1] == t0:
+                # a chunk holding only the start time is the initial state
+                y = y0[:, None]
+            else:
+                y = self._integrate((t0, t_chunk[-1]), y0, t_chunk)
+
+            # continue from the last state of the chunk
+            y0 = y[:, -1]
+            t0 = t_chunk[-1]
+
+            u = self._displacements(y)
+            if beams is None:
+                yield t_chunk, u
+            else:
+                yield t_chunk, self.parse_u(u, beams)
+
+    def write(self, path, chunk_size=100, decimate=1, beams=None):
+        """
+        stream the time history into memory-mapped .npy files in path:
+        t.npy and u.npy with shape (n, nu), or one {beam.name}.npy
+        deformed mesh per beam with shape (n, num_nodes, 3)
+        returns the dictionary of memory-mapped arrays
+        """
+        os.makedirs(path, exist_ok=True)
+        n = len(range(0, self.nt, decimate))
+
+        arrays = {'t': np.lib.format.open_memmap(os.path.join(path, 't.npy'), mode='w+', shape=(n,))}
+        if beams is None:
+            arrays['u'] = np.lib.format.open_memmap(os.path.join(path, 'u.npy'), mode='w+', shape=(n, self.nu))
+        else:
+            for beam in beams:
+                arrays[beam.name] = np.lib.format.open_memmap(os.path.join(path, f'{beam.name}.npy'), 
+                                                              mode='w+', shape=(n, beam.num_nodes, 3))
+
+        start = 0
+        for t, u in self.stream(chunk_size, decimate, beams):
+            stop = start + len(t)
+            arrays['t'][start:stop] = t
+            if beams is None:
+                arrays['u'][start:stop] = u.T
+            else:
+                for beam in beams:
+                    arrays[beam.name][start:stop] = np.moveaxis(u[beam.name], 2, 0)
+            start = stop
+
+        for array in arrays.values():
+            array.flush()
+
+        return arrays
+
+    def _translational_dofs(self, beam):
+        # the (num_nodes, 3) global translational dofs of a beam,
+        # from the node index of the solution or the frame numbering
+        if beam.name not in self._beam_dofs:
+            if self.index is not None:
+                nodes = np.array([self.index[node] for node in self.node_dictionary[beam.name]]) * 6
+            else:
+                nodes = np.asarray(beam.map)
+
+            self._beam_dofs[beam.name] = nodes[:, None] + np.arange(3)
+
+        return self._beam_dofs[beam.name]
+
     def parse_u(self, u, beam):
+        """
+        the (num_nodes, 3, nt) deformed mesh of a beam from the (nu, nt)
+        displacements, or a {beam.name: deformed mesh} dictionary
+        if a list of beams is given
+        """
+        if isinstance(beam, (list, tuple)):
+            return {b.name: self.parse_u(u, b) for b in beam}
+
+        # one fancy index for every node and time step
+        return beam.mesh.value[:, :, None] + u[self._translational_dofs(beam)]
+    
+    def _render(self, mesh_list, options, task, workers=None):
+        # distribute the frames over a pool of processes, each worker draws
+        # every frame into a single figure, results come back in frame order
+        nt = mesh_list[0].shape[2]
+        workers = workers if workers is not None else os.cpu_count()
+        chunksize = max(1, nt // (4 * workers))
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(mesh_list, options)) as executor:
+            yield from executor.map(task, range(nt), chunksize=chunksize)
+
+    def create_frames(self, mesh_list, xlim, ylim, figsize, ax1=1, ax2=2, output_dir='img', workers=None):
+        """
+        write one png per time step to output_dir,
+        rendered in parallel on workers processes (all cores by default)
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        options = {'projection': '2d', 'xlim': xlim, 'ylim': ylim, 'figsize': figsize, 
+                   'ax1': ax1, 'ax2': ax2, 'dpi': 100, 'output_dir': output_dir}
+
+        for _ in self._render(mesh_list, options, _render_png, workers): pass
+
+    def create_frames_3d(self, mesh_list, figsize, dpi, output_dir='img', workers=None):
+        """
+        write one 3d png per time step to output_dir,
+        rendered in parallel on workers processes (all cores by default)
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        options = {'projection': '3d', 'figsize': figsize, 'dpi': dpi, 'output_dir': output_dir}
+
+        for _ in self._render(mesh_list, options, _render_png, workers): pass
+
+    def animate(self, filename, mesh_list, fps, figsize, dpi=100, projection='2d', 
+                xlim=None, ylim=None, ax1=1, ax2=2, workers=None):
+        """
+        render the frames in parallel and pipe them straight into
+        an imageio writer (gif or video, from the filename extension)
+        without writing any intermediate images
+        """
+        import imageio
 
-        def_mesh = np.zeros((beam.num_nodes, 3, self.nt))
+        options = {'projection': projection, 'xlim': xlim, 'ylim': ylim, 'figsize': figsize, 
+                   'ax1': ax1, 'ax2': ax2, 'dpi': dpi}
 
-        for i in range(self.nt):
-            for j in range(beam.num_nodes):
-                node_index = self.index[self.node_dictionary[beam.name][j]] * 6
-                def_mesh[j, :, i] = beam.mesh.value[j, :] + u[node_index:node_index + 3, i]
-        
-        return def_mesh
-    
-    def create_frames(self, mesh_list, xlim, ylim, figsize, ax1=1, ax2=2):
+        with imageio.v2.get_writer(filename, fps=fps) as writer:
+            for frame in self._render(mesh_list, options, _render_array, workers):
+                writer.append_data(frame)
 
-        # fig = plt.figure(figsize=figsize)
-        
-        for i in range(self.nt):
+    def gif(self, filename, fps, output_dir='img'):
+        import imageio
 
-            fig = plt.figure(figsize=figsize)
+        frames = []
+        for i in range(self.nt):
+            image = imageio.v2.imread(os.path.join(output_dir, f'img_{i}.png'))
+            frames.append(image)
 
-            for j in range(len(mesh_list)):
-                mesh = mesh_list[j]
+        # to save the gif with imageio
+        imageio.mimsave(filename, frames, fps=fps)
 
-                # fig = plt.figure(figsize=figsize)
 
-                plt.plot(mesh[:, ax1, i], mesh[:, ax2, i], c='black', linewidth=3, zorder=2, label='_nolegend_')
-                plt.scatter(mesh[:, ax1, i], mesh[:, ax2, i], marker='o', s=100, c='green', edgecolor='black', zorder=3, alpha=1, label='_nolegend_')
+# the figure, artists and data of a rendering worker process
+_worker = {}
 
 
-            plt.xlim(xlim)
-            plt.ylim(ylim)
+def _init_worker(mesh_list, options):
+    plt.switch_backend('Agg')
 
-            # plt.axhline(0, color='black', linewidth=1, zorder=1)
-            # x = np.linspace(xlim[0], xlim[1], 10)
-            # plt.fill_between(x, -10, 0, color='skyblue', alpha=0.4, hatch='/')
+    fig = plt.figure(figsize=options['figsize'], dpi=options['dpi'])
+    lines, points = [], []
 
-            # plt.axvline(0, color='black', linewidth=1, zorder=1)
-            # y = np.linspace(ylim[0], ylim[1], 10)
-            # plt.fill_betweenx(y, x1=-1, x2=0, color='black', alpha=0.4, hatch='/')
+    if options['projection'] == '3d':
+        ax = fig.add_subplot(projection='3d')
+        ax.view_init(elev=20, azim=210)
 
-            plt.xlabel('x (m)')
-            plt.ylabel('y (m)')
+        for mesh in mesh_list:
+            points.append(ax.scatter(mesh[:, 0, 0], mesh[:, 1, 0], mesh[:, 2, 0], color='purple', edgecolor='black', s=15, alpha=1, linewidth=0.5))
+            lines.append(ax.plot(mesh[:, 0, 0], mesh[:, 1, 0], mesh[:, 2, 0], color='black', linewidth=1)[0])
 
-            plt.savefig(f'img/img_{i}.png', transparent=True, dpi=100, facecolor='white', bbox_inches="tight")
+        # fixed equal axes over every frame, so the view does not jump
+        stacked = np.concatenate(mesh_list, axis=0)
+        low, high = stacked.min(axis=(0, 2)), stacked.max(axis=(0, 2))
+        center, radius = (low + high) / 2, np.max(high - low) / 2
+        ax.set_xlim(center[0] - radius, center[0] + radius)
+        ax.set_ylim(center[1] - radius, center[1] + radius)
+        ax.set_zlim(center[2] - radius, center[2] + radius)
+        ax.set_box_aspect((1, 1, 1))
+        ax.axis('off')
+    else:
+        ax1, ax2 = options['ax1'], options['ax2']
+        for mesh in mesh_list:
+            lines.append(plt.plot(mesh[:, ax1, 0], mesh[:, ax2, 0], c='black', linewidth=3, zorder=2, label='_nolegend_')[0])
+            points.append(plt.scatter(mesh[:, ax1, 0], mesh[:, ax2, 0], marker='o', s=100, c='green', edgecolor='black', zorder=3, alpha=1, label='_nolegend_'))
 
-            plt.close()
+        plt.xlim(options['xlim'])
+        plt.ylim(options['ylim'])
+        plt.xlabel('x (m)')
+        plt.ylabel('y (m)')
+        fig.tight_layout()
 
-    def create_frames_3d(self, mesh_list, figsize, dpi):
-        
-        for i in range(self.nt):
+    _worker.update(fig=fig, lines=lines, points=points, mesh_list=mesh_list, options=options)
 
-            fig = plt.figure(figsize=figsize)
-            ax = fig.add_subplot(projection='3d')
-            ax.view_init(elev=20, azim=210)
 
-            for j in range(len(mesh_list)):
-                mesh = mesh_list[j]
+def _draw(i):
+    # update the artist data of the worker figure to time step i
+    options = _worker['options']
 
-                ax.scatter(mesh[:, 0, i], mesh[:, 1, i], mesh[:, 2, i], color='purple', edgecolor='black', s=15, alpha=1, linewidth=0.5)
-                ax.plot(mesh[:, 0, i], mesh[:, 1, i], mesh[:, 2, i], color='black', linewidth=1)
+    for mesh, line, point in zip(_worker['mesh_list'], _worker['lines'], _worker['points']):
+        if options['projection'] == '3d':
+            line.set_data_3d(mesh[:, 0, i], mesh[:, 1, i], mesh[:, 2, i])
+            point._offsets3d = (mesh[:, 0, i], mesh[:, 1, i], mesh[:, 2, i])
+        else:
+            x, y = mesh[:, options['ax1'], i], mesh[:, options['ax2'], i]
+            line.set_data(x, y)
+            point.set_offsets(np.column_stack((x, y)))
 
-            ax.axis('equal')
-            plt.axis('off')
+    return _worker['fig']
 
-            plt.savefig(f'img/img_{i}.png', transparent=True, dpi=dpi, facecolor='white', bbox_inches="tight")
 
-            plt.close()
+def _render_png(i):
+    fig = _draw(i)
+    options = _worker['options']
+    fig.savefig(os.path.join(options['output_dir'], f'img_{i}.png'), transparent=True, 
+                dpi=options['dpi'], facecolor='white', bbox_inches="tight")
 
-    def gif(self, filename, fps):
-        import imageio
 
-        frames = []
-        for i in range(self.nt):
-            image = imageio.v2.imread(f'img/img_{i}.png')
-            frames.append(image)
+def _render_array(i):
+    fig = _draw(i)
+    fig.canvas.draw()
 
-        # to save the gif with imageio
-        imageio.mimsave(filename, frames, fps=fps)
\ No newline at end of file
+    # the rgb pixels of the figure
+    return np.asarray(fig.canvas.buffer_rgba())[:, :, 0:3].copy()
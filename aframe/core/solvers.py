@@ -0,0 +1,592 @@
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import scipy.linalg as sla
+import csdl_alpha as csdl
+import hashlib
+import warnings
+from collections import OrderedDict
+from typing import List
+
+
+class FactorCache:
+    """
+    a least-recently-used cache of factorizations
+    keyed on a hash of the stiffness values
+    """
+    def __init__(self, maxsize:int=8):
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    @staticmethod
+    def hash(*arrays:np.ndarray)->str:
+        h = hashlib.sha1()
+        for array in arrays:
+            h.update(np.ascontiguousarray(array).tobytes())
+
+        return h.hexdigest()
+
+
+    def get(self, key, factory):
+        """
+        return the entry for key, creating it with factory() on a miss
+        """
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses += 1
+        entry = factory()
+        self._entries[key] = entry
+
+        # evict the least recently used entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+        return entry
+
+
+    def clear(self):
+
+        self.hits = 0
+        self.misses = 0
+        self._entries.clear()
+
+
+
+class Jacobian(spla.LinearOperator):
+    """
+    a jacobian applied through its products with vectors and matrices,
+    e.g. with back-substitutions on a factorization
+    product and transpose_product take arrays of shape (n,) or (n, k)
+    the full matrix is only formed (one product per column) if a
+    consumer converts it with toarray() or np.asarray
+    """
+    def __init__(self, shape:tuple, product, transpose_product):
+        super().__init__(float, shape)
+
+        self._product = product
+        self._transpose_product = transpose_product
+
+
+    def _matvec(self, v):
+        return self._product(np.ravel(v))
+
+
+    def _matmat(self, V):
+        return self._product(np.asarray(V))
+
+
+    def _rmatvec(self, v):
+        return self._transpose_product(np.ravel(v))
+
+
+    def _rmatmat(self, V):
+        return self._transpose_product(np.asarray(V))
+
+
+    def toarray(self)->np.ndarray:
+        return self._matmat(np.eye(self.shape[1]))
+
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+
+
+class LinearSolve(csdl.CustomExplicitOperation):
+    """
+    solve K U = F where K is stored as COO data
+    on a fixed sparsity pattern
+    F may hold one load case per row, shape: (n_cases, dim),
+    in which case K is factored once for all of them
+    subclasses provide the factorization
+
+    with a FactorCache, the factorization is reused whenever the
+    stiffness values repeat, both for the solve and for the
+    adjoint back-substitutions of the derivatives
+    """
+    def __init__(self, rows:np.ndarray, cols:np.ndarray, dim:int, cache:FactorCache=None):
+        super().__init__()
+
+        self.rows = rows
+        self.cols = cols
+        self.dim = dim
+        self.cache = cache
+        # distinguishes solvers and sparsity patterns sharing a cache
+        self._key = (type(self).__name__, dim, FactorCache.hash(*[a for a in (rows, cols) if a is not None]))
+
+
+    def evaluate(self, data:csdl.Variable, b:csdl.Variable)->csdl.Variable:
+
+        self.declare_input('data', data)
+        self.declare_input('b', b)
+
+        x = self.create_output('x', b.shape)
+
+        return x
+
+
+    def _factor(self, data):
+        raise NotImplementedError
+
+
+    def _solve(self, factor, b:np.ndarray, transpose:bool=False)->np.ndarray:
+        """
+        solve K x = b (or K^T x = b) for the columns of b
+        """
+        raise NotImplementedError
+
+
+    def _factorization(self, data:np.ndarray):
+
+        if self.cache is None:
+            return self._factor(data)
+        
+        # only the factorization is cached, never an inverse
+        key = self._key + (FactorCache.hash(data),)
+        return self.cache.get(key, lambda: self._factor(data))
+
+
+    def compute(self, input_vals, output_vals):
+
+        factor = self._factorization(input_vals['data'])
+        # the load cases are solved as the columns of one right-hand side
+        output_vals['x'] = self._solve(factor, input_vals['b'].T).T
+
+
+    def compute_derivatives(self, input_vals, output_vals, derivatives):
+
+        factor = self._factorization(input_vals['data'])
+        # shape: (n_cases, dim)
+        x = np.atleast_2d(output_vals['x'])
+        n = x.size
+        nnz = input_vals['data'].size
+
+        def solve(v, transpose=False):
+            # one back-substitution per vector, v has shape (n,) or (n, k)
+            k = v.size // n
+            columns = v.reshape(x.shape + (k,)).transpose(1, 0, 2).reshape(self.dim, -1)
+            solution = self._solve(factor, columns, transpose)
+            return solution.reshape(self.dim, x.shape[0], k).transpose(1, 0, 2).reshape(v.shape)
+
+        def data_product(v):
+            # the tangent dx = -K^-1 dK x
+            v = v.reshape(nnz, -1)
+            products = np.stack([self._product(vi, x) for vi in v.T], axis=-1)
+            return -solve(products.reshape(n, -1)).reshape(n, -1)
+
+        def data_adjoint(v):
+            # the adjoint K^T lambda = x_bar gives data_bar = -lambda[rows] x[cols]
+            adjoint = solve(v.reshape(n, -1), transpose=True)
+            cotangents = [self._data_cotangent(a.reshape(x.shape), x) for a in adjoint.T]
+            return np.stack(cotangents, axis=-1)
+
+        # the jacobians are applied with the factorization and never formed
+        derivatives['x', 'b'] = Jacobian((n, n), solve, lambda v: solve(v, True))
+        derivatives['x', 'data'] = Jacobian((n, nnz), data_product, data_adjoint)
+
+
+    def _product(self, data:np.ndarray, x:np.ndarray)->np.ndarray:
+        """
+        the product of the matrix stored as data with every row of x
+        """
+        K = sp.csr_matrix((data, (self.rows, self.cols)), shape=(self.dim, self.dim))
+        return (K @ x.T).T
+
+
+    def _data_cotangent(self, adjoint:np.ndarray, x:np.ndarray)->np.ndarray:
+        """
+        -sum over the load cases of adjoint[rows] * x[cols]
+        """
+        return -np.sum(adjoint[:, self.rows] * x[:, self.cols], axis=0)
+
+
+
+class SparseSolve(LinearSolve):
+    """
+    sparse LU factorization
+    """
+    def _factor(self, data):
+        K = sp.csc_matrix((data, (self.rows, self.cols)), shape=(self.dim, self.dim))
+        return spla.splu(K)
+
+
+    def _solve(self, factor, b, transpose=False):
+        return factor.solve(b, trans='T' if transpose else 'N')
+
+
+
+class BandedSolve(LinearSolve):
+    """
+    banded Cholesky factorization for symmetric positive definite K
+    the cost is O(n b^2) for a half-bandwidth b
+    """
+    def __init__(self, rows:np.ndarray, cols:np.ndarray, dim:int, cache:FactorCache=None):
+        super().__init__(rows, cols, dim, cache)
+
+        # the lower triangle in LAPACK banded storage: ab[r - c, c] = K[r, c]
+        self.lower = rows >= cols
+        self.bandwidth = int(np.max(rows - cols))
+
+
+    def _factor(self, data):
+        ab = np.zeros((self.bandwidth + 1, self.dim))
+        rows, cols = self.rows[self.lower], self.cols[self.lower]
+        ab[rows - cols, cols] = data[self.lower]
+
+        return sla.cholesky_banded(ab, lower=True)
+
+
+    def _solve(self, factor, b, transpose=False):
+        # K is symmetric
+        return sla.cho_solve_banded((factor, True), b)
+
+
+    def _product(self, data, x):
+        # only the lower triangle is read, and it stands in for both halves
+        rows, cols = self.rows[self.lower], self.cols[self.lower]
+        lower = sp.csr_matrix((data[self.lower], (rows, cols)), shape=(self.dim, self.dim))
+        K = lower + sp.triu(lower.T, k=1)
+
+        return (K @ x.T).T
+
+
+    def _data_cotangent(self, adjoint, x):
+        rows, cols = self.rows[self.lower], self.cols[self.lower]
+        off_diagonal = rows != cols
+
+        cotangent = np.zeros(self.rows.size)
+        cotangent[self.lower] = -np.sum(adjoint[:, rows] * x[:, cols] + off_diagonal * adjoint[:, cols] * x[:, rows], axis=0)
+
+        return cotangent
+
+
+
+class DenseSolve(LinearSolve):
+    """
+    dense LU factorization of a (dim, dim) matrix
+    """
+    def __init__(self, dim:int, cache:FactorCache=None):
+        super().__init__(None, None, dim, cache)
+
+
+    def _factor(self, data):
+        return sla.lu_factor(data)
+
+
+    def _solve(self, factor, b, transpose=False):
+        return sla.lu_solve(factor, b, trans=1 if transpose else 0)
+
+
+    def _product(self, data, x):
+        return (data.reshape(self.dim, self.dim) @ x.T).T
+
+
+    def _data_cotangent(self, adjoint, x):
+        # -sum over the load cases of outer(adjoint, x)
+        return -(adjoint.T @ x).ravel()
+
+
+
+class ConjugateGradientSolve(csdl.CustomExplicitOperation):
+    """
+    solve K U = F without forming K
+    K @ u is applied element by element from the (num_elements, 12, 12)
+    stiffness matrices of each beam, and the constrained dofs are
+    zeroed with a unit diagonal as in the assembled modes
+    the preconditioner is the inverse of the 6x6 nodal diagonal blocks
+    (block-Jacobi)
+
+    info holds the iteration count, the relative residual history and
+    the convergence flag of the latest forward solve, and the iteration
+    count and convergence flag of the latest adjoint solve
+    a solve that stops at maxiter above tol issues a RuntimeWarning
+    """
+    def __init__(self, 
+                 dofs:List[np.ndarray], 
+                 dim:int, 
+                 constrained:np.ndarray, 
+                 tol:float=1E-10, 
+                 maxiter:int=None):
+        super().__init__()
+
+        self.dofs = dofs
+        self.dim = dim
+        self.tol = tol
+        self.maxiter = maxiter if maxiter is not None else 10 * dim
+        self.info = {'iterations': 0, 'residuals': [], 'converged': None, 
+                     'adjoint_iterations': 0, 'adjoint_converged': None}
+
+        # 1 on the free dofs, 0 on the constrained dofs
+        self.mask = np.ones(dim)
+        self.mask[constrained] = 0
+
+        # sparse matrices summing the element vectors into the global vector
+        self.scatters = []
+        for element_dofs in dofs:
+            n = element_dofs.size
+            self.scatters.append(sp.csr_matrix((np.ones(n), (element_dofs.ravel(), np.arange(n))), shape=(dim, n)))
+
+
+    def evaluate(self, b:csdl.Variable, *matrices:csdl.Variable)->csdl.Variable:
+
+        self.declare_input('b', b)
+        for i, matrix in enumerate(matrices):
+            self.declare_input(f'k{i}', matrix)
+
+        x = self.create_output('x', b.shape)
+
+        return x
+
+
+    def _apply(self, matrices, u:np.ndarray)->np.ndarray:
+        """
+        K_bc @ u for u of shape (dim, k)
+        """
+        masked = self.mask[:, None] * u
+
+        y = np.zeros_like(u)
+        for matrix, element_dofs, scatter in zip(matrices, self.dofs, self.scatters):
+            # shape: (num_elements, 12, k)
+            element_u = masked[element_dofs]
+            element_y = np.einsum('eij,ejk->eik', matrix, element_u)
+            y += scatter @ element_y.reshape(-1, u.shape[1])
+
+        return self.mask[:, None] * y + (1 - self.mask[:, None]) * u
+
+
+    def _preconditioner(self, matrices)->np.ndarray:
+        """
+        the inverted 6x6 nodal diagonal blocks of K_bc
+        """
+        num = self.dim // 6
+        blocks = np.zeros((num, 6, 6))
+        for matrix, element_dofs in zip(matrices, self.dofs):
+            np.add.at(blocks, element_dofs[:, 0] // 6, matrix[:, :6, :6])
+            np.add.at(blocks, element_dofs[:, 6] // 6, matrix[:, 6:, 6:])
+
+        # zero the constrained rows/columns and put a 1 in the diagonal
+        mask = self.mask.reshape(num, 6)
+        blocks = mask[:, :, None] * blocks * mask[:, None, :]
+        blocks += np.einsum('ni,ij->nij', 1 - mask, np.eye(6))
+
+        return np.linalg.inv(blocks)
+
+
+    def _pcg(self, matrices, b:np.ndarray)->tuple[np.ndarray, int, list]:
+        """
+        preconditioned conjugate gradient iterations on every
+        column of b at once
+        """
+        num = self.dim // 6
+        preconditioner = self._preconditioner(matrices)
+        precondition = lambda r: np.einsum('nij,njk->nik', preconditioner, r.reshape(num, 6, -1)).reshape(r.shape)
+
+        b_norm = np.linalg.norm(b, axis=0)
+        b_norm[b_norm == 0] = 1
+
+        x = np.zeros_like(b)
+        r = b.copy()
+        z = precondition(r)
+        p = z.copy()
+        rz = np.sum(r * z, axis=0)
+
+        residuals = [np.max(np.linalg.norm(r, axis=0) / b_norm)]
+        iterations = 0
+        while residuals[-1] > self.tol and iterations < self.maxiter:
+            Ap = self._apply(matrices, p)
+            pAp = np.sum(p * Ap, axis=0)
+            alpha = np.divide(rz, pAp, out=np.zeros_like(rz), where=pAp != 0)
+
+            x += alpha * p
+            r -= alpha * Ap
+            iterations += 1
+            residuals.append(np.max(np.linalg.norm(r, axis=0) / b_norm))
+
+            z = precondition(r)
+            rz_new = np.sum(r * z, axis=0)
+            beta = np.divide(rz_new, rz, out=np.zeros_like(rz), where=rz != 0)
+            p = z + beta * p
+            rz = rz_new
+
+        if residuals[-1] > self.tol:
+            warnings.warn(f"the cg solve did not converge in {iterations} iterations, "
+                          f"the relative residual is {residuals[-1]:.2e}", RuntimeWarning)
+
+        return x, iterations, residuals
+
+
+    def _matrices(self, input_vals)->list:
+        return [input_vals[f'k{i}'] for i in range(len(self.dofs))]
+
+
+    def compute(self, input_vals, output_vals):
+
+        b = input_vals['b']
+        # the load cases are solved as the columns of one right-hand side
+        x, iterations, residuals = self._pcg(self._matrices(input_vals), np.atleast_2d(b).T.copy())
+
+        self.info['iterations'] = iterations
+        self.info['residuals'] = residuals
+        self.info['converged'] = residuals[-1] <= self.tol
+        output_vals['x'] = x.T.reshape(b.shape)
+
+
+    def compute_derivatives(self, input_vals, output_vals, derivatives):
+
+        matrices = self._matrices(input_vals)
+        # shape: (n_cases, dim)
+        x = np.atleast_2d(output_vals['x'])
+        n = x.size
+        masked_x = self.mask * x
+        # the latest adjoint solve, shared by the b and k_i jacobians
+        latest = {}
+
+        def solve(v, adjoint=False):
+            # v has shape (n,) or (n, k), every case and column is one pcg column
+            k = v.size // n
+            columns = v.reshape(x.shape + (k,)).transpose(1, 0, 2).reshape(self.dim, -1)
+            solution, iterations, residuals = self._pcg(matrices, columns.copy())
+            if adjoint:
+                self.info['adjoint_iterations'] = iterations
+                self.info['adjoint_converged'] = residuals[-1] <= self.tol
+            return solution.reshape(self.dim, x.shape[0], k).transpose(1, 0, 2).reshape(v.shape)
+
+        def adjoint_solve(v):
+            # K_bc is symmetric, so the adjoint is one more pcg solve with the cotangent
+            key = FactorCache.hash(v)
+            if latest.get('key') != key:
+                latest['key'], latest['adjoint'] = key, solve(v, adjoint=True)
+            return latest['adjoint']
+
+        derivatives['x', 'b'] = Jacobian((n, n), solve, adjoint_solve)
+
+        for i, element_dofs in enumerate(self.dofs):
+            derivatives['x', f'k{i}'] = self._stiffness_derivative(element_dofs, masked_x, solve, adjoint_solve)
+
+
+    def _stiffness_derivative(self, element_dofs, masked_x, solve, adjoint_solve)->Jacobian:
+        """
+        dK_bc/dk_eij = P e_i e_j^T P applied without forming the jacobian
+        """
+        n = masked_x.size
+        nnz = element_dofs.size * 12
+        # shape: (num_elements, 12, n_cases)
+        element_x = masked_x.T[element_dofs]
+
+        def product(v):
+            # the tangent dx = -K_bc^-1 P dk P x
+            k = v.size // nnz
+            element_y = np.einsum('eijk,ejc->eick', v.reshape(-1, 12, 12, k), element_x)
+            y = np.zeros((self.dim,) + element_y.shape[2:])
+            np.add.at(y, element_dofs, element_y)
+            y = self.mask[:, None, None] * y
+            return -solve(y.transpose(1, 0, 2).reshape(n, k)).reshape((n,) + v.shape[1:])
+
+        def cotangent(v):
+            # dk_bar_eij = -sum over the load cases of (P lambda)_i (P x)_j
+            adjoint = adjoint_solve(v).reshape(masked_x.shape + (-1,))
+            element_adjoint = (self.mask[:, None, None] * adjoint.transpose(1, 0, 2))[element_dofs]
+            dk = -np.einsum('eick,ejc->eijk', element_adjoint, element_x)
+            return dk.reshape((nnz,) + v.shape[1:])
+
+        return Jacobian((n, nnz), product, cotangent)
+
+
+
+class EigenSolve(csdl.CustomExplicitOperation):
+    """
+    the lowest n_modes eigenpairs of K phi = lambda M phi
+    with K and M stored as COO data on a fixed sparsity pattern
+    solved with shift-invert Lanczos iterations (eigsh) about sigma
+
+    the eigenvectors are mass normalized (phi^T M phi = 1), which gives
+    the eigenvalue derivatives
+    dlambda/dK_rc = phi_r phi_c and dlambda/dM_rc = -lambda phi_r phi_c
+    the eigenvectors themselves are not differentiated
+    """
+    def __init__(self, 
+                 rows:np.ndarray, 
+                 cols:np.ndarray, 
+                 dim:int, 
+                 n_modes:int, 
+                 sigma:float=0.):
+        super().__init__()
+
+        if not 0 < n_modes <= dim:
+            raise ValueError(f"n_modes must be between 1 and {dim}")
+
+        self.rows = rows
+        self.cols = cols
+        self.dim = dim
+        self.n_modes = n_modes
+        self.sigma = sigma
+
+
+    def evaluate(self, K:csdl.Variable, M:csdl.Variable)->tuple[csdl.Variable, csdl.Variable]:
+
+        self.declare_input('K', K)
+        self.declare_input('M', M)
+
+        eigenvalues = self.create_output('eigenvalues', (self.n_modes,))
+        eigenvectors = self.create_output('eigenvectors', (self.n_modes, self.dim))
+
+        self.declare_derivative_parameters('eigenvectors', 'K', dependent=False)
+        self.declare_derivative_parameters('eigenvectors', 'M', dependent=False)
+
+        return eigenvalues, eigenvectors
+
+
+    def _matrix(self, data):
+        return sp.csc_matrix((data, (self.rows, self.cols)), shape=(self.dim, self.dim))
+
+
+    def _eigenpairs(self, input_vals)->tuple[np.ndarray, np.ndarray]:
+
+        K = self._matrix(input_vals['K'])
+        M = self._matrix(input_vals['M'])
+
+        # eigsh needs fewer modes than dofs, small systems are solved densely
+        if self.n_modes < self.dim - 1:
+            eigenvalues, eigenvectors = spla.eigsh(K, k=self.n_modes, M=M, sigma=self.sigma, which='LM')
+        else:
+            eigenvalues, eigenvectors = sla.eigh(K.toarray(), M.toarray(), subset_by_index=[0, self.n_modes - 1])
+
+        order = np.argsort(eigenvalues)
+        eigenvalues, eigenvectors = eigenvalues[order], eigenvectors[:, order]
+
+        # mass normalize and fix the sign so the largest entry is positive
+        eigenvectors /= np.sqrt(np.einsum('ik,ik->k', eigenvectors, M @ eigenvectors))
+        largest = eigenvectors[np.argmax(np.abs(eigenvectors), axis=0), np.arange(self.n_modes)]
+        eigenvectors *= np.sign(largest)
+
+        return eigenvalues, eigenvectors
+
+
+    def compute(self, input_vals, output_vals):
+
+        eigenvalues, eigenvectors = self._eigenpairs(input_vals)
+
+        output_vals['eigenvalues'] = eigenvalues
+        output_vals['eigenvectors'] = eigenvectors.T
+
+
+    def compute_derivatives(self, input_vals, output_vals, derivatives):
+
+        eigenvalues = output_vals['eigenvalues']
+        # shape: (n_modes, nnz)
+        phi = output_vals['eigenvectors']
+        outer = phi[:, self.rows] * phi[:, self.cols]
+
+        derivatives['eigenvalues', 'K'] = outer
+        derivatives['eigenvalues', 'M'] = -eigenvalues[:, None] * outer
@@ -1,52 +1,341 @@
 import numpy as np
+import scipy.sparse as sp
+import time
+import csdl_alpha as csdl
+from scipy.spatial import cKDTree
 
 
 
 class NodalMap:
-    def __init__(self, mesh_in: np.ndarray, mesh_out: np.ndarray, method='rbf'):
+    def __init__(self, 
+                 mesh_in: np.ndarray, 
+                 mesh_out: np.ndarray, 
+                 method='rbf', 
+                 k: int = None, 
+                 radius: float = None, 
+                 eps=1, 
+                 power=2):
+        """
+        interpolate values from the n points of mesh_in to the m points of mesh_out
+        the weights are computed once and stored as a sparse (m, n) transfer matrix
+
+        method: 'rbf' (Gaussian), 'idw' (inverse distance) or
+        'wendland' (compact support C2 Wendland RBF of the given radius)
+        k: only use the k nearest input points of each output point
+        radius: only use the input points within radius of each output point
+        (all input points are used if neither is given)
+        """
         self.mesh_in = mesh_in
         self.mesh_out = mesh_out
         self.n, _ = mesh_in.shape
         self.m, _ = mesh_out.shape
         self.method = method
+        self.k = k
+        self.radius = radius
 
+        if method == 'wendland' and radius is None:
+            raise ValueError("the wendland kernel needs a support radius")
 
-    def rbf_weighting(self, eps=1):
-        # Compute the pairwise distances between each target point and all source points
-        distances = np.linalg.norm(mesh_in[:, np.newaxis, :] - mesh_out[np.newaxis, :, :], axis=2)
+        self._neighbours()
+
+        if method == 'rbf':
+            weights = self.rbf_weighting(eps)
+        elif method == 'idw':
+            weights = self.inverse_distance_weighting(power)
+        elif method == 'wendland':
+            weights = self.wendland_weighting(radius)
+        else:
+            raise ValueError(f"Invalid method: {self.method}")
+        
+        # the (m, n) transfer matrix
+        self.matrix = weights.T.tocsr()
+        # the (6n, 3m) load transfer matrix, built on first use
+        self._load_matrix = None
+
+
+    def _neighbours(self):
+        # the (output, input) point pairs and their distances from a KD-tree search
+        tree = cKDTree(self.mesh_in)
+
+        if self.k is not None or self.radius is None:
+            k = min(self.k, self.n) if self.k is not None else self.n
+            distances, cols = tree.query(self.mesh_out, k=k)
+            distances, cols = distances.reshape(self.m, k), cols.reshape(self.m, k)
+            rows = np.repeat(np.arange(self.m), k)
+
+            # k-nearest neighbours limited to the radius
+            kept = np.isfinite(distances.ravel())
+            if self.radius is not None:
+                kept &= distances.ravel() <= self.radius
 
+            self._rows, self._cols, self._distances = rows[kept], cols.ravel()[kept], distances.ravel()[kept]
+        else:
+            pairs = cKDTree(self.mesh_out).sparse_distance_matrix(tree, self.radius, output_type='ndarray')
+            self._rows, self._cols, self._distances = pairs['i'], pairs['j'], pairs['v']
+
+
+    def _normalized(self, weights):
+        # normalize the weights of each output point and return them as a sparse (n, m) matrix
+        sums = np.bincount(self._rows, weights=weights, minlength=self.m)
+        # output points without any neighbours are not moved
+        sums[sums == 0] = 1
+        weights = weights / sums[self._rows]
+
+        return sp.csc_matrix((weights, (self._cols, self._rows)), shape=(self.n, self.m))
+
+
+    def rbf_weighting(self, eps=1):
         # Apply the radial basis function formula
         # Gaussian kernel
-        weights = np.exp(-eps * distances**2)
+        weights = np.exp(-eps * self._distances**2)
         # Thin-plate spline kernel
         # weights = distances**4 * np.log(distances + 1e-6)
-        weights /= weights.sum(axis=0, keepdims=True)  # Normalize the weights
         
-        return weights
+        return self._normalized(weights)
 
 
     def inverse_distance_weighting(self, power=2):
-        # Compute the pairwise distances between each target point and all source points
-        distances = np.linalg.norm(mesh_in[:, np.newaxis, :] - mesh_out[np.newaxis, :, :], axis=2)
-        
         # Apply the inverse distance weighting formula
         with np.errstate(divide='ignore'):  # To handle division by zero
-            weights = 1.0 / distances**power
-            weights /= weights.sum(axis=0, keepdims=True)  # Normalize the weights
+            weights = 1.0 / self._distances**power
+
+        # output points coinciding with an input point take its value
+        coincident = np.isinf(weights)
+        has_coincident = np.bincount(self._rows[coincident], minlength=self.m) > 0
+        weights = np.where(has_coincident[self._rows], coincident.astype(float), weights)
         
-        return weights
+        return self._normalized(weights)
+    
+
+    def wendland_weighting(self, radius):
+        # compact support C2 Wendland kernel, zero beyond the radius
+        r = self._distances / radius
+        weights = np.clip(1 - r, 0, None)**4 * (4 * r + 1)
+
+        return self._normalized(weights)
     
     
     def evaluate(self, values):
+        """
+        map (n, 3) or batched (n_steps, n, 3) values to the
+        deformed (m, 3) or (n_steps, m, 3) output mesh
+        """
+        values = np.asarray(values)
 
-        if self.method == 'rbf':
-            weights = self.rbf_weighting()
-        elif self.method == 'idw':
-            weights = self.inverse_distance_weighting()
-        else:
-            raise ValueError(f"Invalid method: {self.method}")
+        if values.ndim == 3:
+            # one sparse product for every step, shape: (n, n_steps * 3)
+            n_steps = values.shape[0]
+            stacked = values.transpose(1, 0, 2).reshape(self.n, -1)
+            mapped = (self.matrix @ stacked).reshape(self.m, n_steps, -1).transpose(1, 0, 2)
+
+            return self.mesh_out[np.newaxis] + mapped
+        
+        return self.mesh_out + self.matrix @ values
+
+    
+
+    @property
+    def load_matrix(self):
+        """
+        the (6n, 3m) conservative load transfer matrix
+        the forces are the transpose of the displacement transfer,
+        f_in = H^T f_out, so the virtual work is the same on both meshes,
+        and every force adds the moment (r_out - r_in) x f_out about
+        the input points it is transferred to
+        """
+        if self._load_matrix is None:
+            H = self.matrix.tocoo()
+            out, node, w = H.row, H.col, H.data
+            # the lever arms from the input points, shape: (nnz, 3)
+            r = self.mesh_out[out] - self.mesh_in[node]
+
+            # the force entries, f_in[node, i] += w f_out[out, i]
+            rows = [6 * node + i for i in range(3)]
+            cols = [3 * out + i for i in range(3)]
+            data = [w] * 3
+
+            # the moment entries, m_in[node] += w skew(r) f_out[out]
+            skew = {(0, 1): -r[:, 2], (0, 2): r[:, 1], (1, 0): r[:, 2], 
+                    (1, 2): -r[:, 0], (2, 0): -r[:, 1], (2, 1): r[:, 0]}
+            for (p, q), value in skew.items():
+                rows.append(6 * node + 3 + p)
+                cols.append(3 * out + q)
+                data.append(w * value)
+
+            self._load_matrix = sp.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), 
+                                              shape=(6 * self.n, 3 * self.m))
+        
+        return self._load_matrix
+    
+
+    def transfer_loads(self, forces):
+        """
+        transfer (m, 3) forces on mesh_out to (n, 6) forces and moments
+        on mesh_in, (n_steps, m, 3) numpy forces are transferred in one product
+        csdl variables return a differentiable csdl variable
+        """
+        if isinstance(forces, csdl.Variable):
+            return LoadTransfer(self.load_matrix).evaluate(forces)
+        
+        forces = np.asarray(forces)
+        if forces.ndim == 3:
+            n_steps = forces.shape[0]
+            return (self.load_matrix @ forces.reshape(n_steps, -1).T).T.reshape(n_steps, self.n, 6)
+
+        return (self.load_matrix @ forces.ravel()).reshape(self.n, 6)
+
+
+
+class LoadTransfer(csdl.CustomExplicitOperation):
+    """
+    apply a constant sparse load transfer matrix
+    to (m, 3) forces, giving (n, 6) loads
+    """
+    def __init__(self, matrix:sp.csr_matrix):
+        super().__init__()
+
+        self.matrix = matrix
+        self.n = matrix.shape[0] // 6
+
+
+    def evaluate(self, forces:csdl.Variable)->csdl.Variable:
+
+        self.declare_input('forces', forces)
+        loads = self.create_output('loads', (self.n, 6))
+
+        return loads
+
+
+    def compute(self, input_vals, output_vals):
+
+        output_vals['loads'] = (self.matrix @ input_vals['forces'].ravel()).reshape(self.n, 6)
+
+
+    def compute_derivatives(self, input_vals, output_vals, derivatives):
+
+        derivatives['loads', 'forces'] = self.matrix
+
+
+
+
+class AeroelasticCoupling:
+    def __init__(self, 
+                 recorder: csdl.Recorder, 
+                 frame, 
+                 components: list, 
+                 aero, 
+                 relaxation='aitken', 
+                 omega=0.5, 
+                 depth=5, 
+                 tol=1E-8, 
+                 maxiter=50):
+        """
+        static aeroelastic coupling by fixed-point iteration
+        displacements -> aero meshes -> aero forces -> beam loads -> displacements
+
+        components: a list of (beam, loads, nodal_map) triples, one per
+        coupled beam, the frame must already be solved with the (n, 6)
+        loads added to each beam
+        every structural solve re-executes the recorded graph with new load
+        values, the frame needs a cache_size so its stiffness factorization
+        is reused across the iterations (the matrix-free cg solver has none)
+
+        aero: callback taking the list of deformed (m, 3) aero meshes
+        (one per component) and returning the list of (m, 3) aero forces
+        relaxation: 'aitken' (dynamic relaxation factor starting at omega),
+        'anderson' (mixing omega, using the last depth iterates) or 'constant'
+        """
+        if relaxation not in ('aitken', 'anderson', 'constant'):
+            raise ValueError(f"Invalid relaxation: {relaxation}")
         
-        return self.mesh_out + weights.T @ values
+        if frame.factor_cache is None and not frame.matrix_free:
+            raise ValueError("the frame needs a cache_size to reuse its factorization across the coupling iterations")
+
+        self.recorder = recorder
+        self.frame = frame
+        self.components = components
+        self.aero = aero
+        self.relaxation = relaxation
+        self.omega = omega
+        self.depth = depth
+        self.tol = tol
+        self.maxiter = maxiter
+
+        # the offsets of each component's loads in the stacked load vector
+        self.offsets = np.cumsum([0] + [loads.size for _, loads, _ in components])
+
+        # the relative load residual of every iteration
+        self.history = []
+        # the accumulated wall time of each phase
+        self.timings = {'aero': 0., 'transfer': 0., 'structure': 0.}
+        self.converged = False
+
+
+    def _residual(self, x):
+        # one pass of the coupling map, returns the new loads minus the current loads
+        t0 = time.perf_counter()
+        meshes = [nodal_map.evaluate(self.frame.displacement[beam.name].value) for beam, _, nodal_map in self.components]
+        forces = self.aero(meshes)
+        t1 = time.perf_counter()
+        new_loads = np.concatenate([nodal_map.transfer_loads(force).ravel() 
+                                    for (_, _, nodal_map), force in zip(self.components, forces)])
+        t2 = time.perf_counter()
+
+        self.timings['aero'] += t1 - t0
+        self.timings['transfer'] += t2 - t1
+
+        return new_loads - x, np.linalg.norm(new_loads)
+
+
+    def _structure(self, x):
+        t0 = time.perf_counter()
+        for i, (_, loads, _) in enumerate(self.components):
+            loads.value = x[self.offsets[i]:self.offsets[i + 1]].reshape(loads.shape)
+        self.recorder.execute()
+        self.timings['structure'] += time.perf_counter() - t0
+
+
+    def solve(self):
+        """
+        iterate until the relative load residual is below tol,
+        returns the list of converged (n, 6) loads of the components
+        """
+        x = np.concatenate([loads.value.ravel() for _, loads, _ in self.components])
+        omega = self.omega
+        X, R = [], []
+        r_old = None
+
+        for _ in range(self.maxiter):
+            r, scale = self._residual(x)
+            self.history.append(np.linalg.norm(r) / max(scale, 1E-300))
+
+            if self.history[-1] < self.tol:
+                self.converged = True
+                break
+
+            if self.relaxation == 'anderson':
+                X.append(x.copy())
+                R.append(r.copy())
+                X, R = X[-(self.depth + 1):], R[-(self.depth + 1):]
+                x = x + omega * r
+
+                if len(R) > 1:
+                    # least squares mixing of the previous iterates
+                    dR = np.diff(np.array(R), axis=0).T
+                    dX = np.diff(np.array(X), axis=0).T
+                    gamma = np.linalg.lstsq(dR, r, rcond=None)[0]
+                    x = x - (dX + omega * dR) @ gamma
+            else:
+                if self.relaxation == 'aitken' and r_old is not None:
+                    dr = r - r_old
+                    if dr @ dr > 0:
+                        omega = -omega * (r_old @ dr) / (dr @ dr)
+                r_old = r
+                x = x + omega * r
+
+            self._structure(x)
+
+        return [x[self.offsets[i]:self.offsets[i + 1]].reshape(loads.shape) for i, (_, loads, _) in enumerate(self.components)]
 
 
 
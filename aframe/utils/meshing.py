@@ -2,7 +2,7 @@ import numpy as np
 
 
 
-def mesh_from_points_and_edges(points, edges, num_nodes):
+def mesh_from_points_and_edges(points, edges, num_nodes, spacing=None):
     """
     Create a 3D linspace mesh for each edge.
 
@@ -10,23 +10,143 @@ def mesh_from_points_and_edges(points, edges, num_nodes):
     points (numpy array): Array of shape (num_points, 3) containing the coordinates of the points.
     edges (numpy array): Array of shape (num_edges, 2) containing the point connectivity.
     num_nodes (int): The number of nodes to generate along each edge.
+    spacing (numpy array, optional): Array of shape (num_nodes,) of increasing positions along
+        each edge from 0 (start point) to 1 (end point), uniform by default.
 
     Returns:
     numpy array: Array of shape (num_edges, num_nodes, 3) containing the mesh points for each edge.
     """
-    # Initialize the output array
-    mesh_points = np.zeros((edges.shape[0], num_nodes, 3))
+    points = np.asarray(points, dtype=float)
+    edges = np.asarray(edges)
+    s = _spacing(num_nodes, spacing)
+
+    start_points = points[edges[:, 0]]
+    end_points = points[edges[:, 1]]
+
+    # every edge at once, shape: (num_edges, num_nodes, 3)
+    return start_points[:, None, :] + s[None, :, None] * (end_points - start_points)[:, None, :]
+
+
+def truss_mesh(points, edges, num_nodes, spacing=None):
+    """
+    Mesh a truss/frame topology with shared nodes at the points.
+
+    Parameters:
+    points (numpy array): Array of shape (num_points, 3) containing the coordinates of the points,
+        points with identical coordinates are merged.
+    edges (numpy array): Array of shape (num_edges, 2) containing the point connectivity.
+    num_nodes (int): The number of nodes to generate along each edge.
+    spacing (numpy array, optional): Array of shape (num_nodes,) of increasing positions along
+        each edge from 0 to 1, uniform by default.
+
+    Returns:
+    nodes (numpy array): Array of shape (num_unique_nodes, 3) containing the deduplicated nodes.
+    connectivity (numpy array): Array of shape (num_edges, num_nodes) containing the node
+        index of every edge node, nodes[connectivity[i]] is the mesh of edge i.
+    joints (list): One {'members': [edge indices], 'nodes': [edge node indices]} entry per
+        point shared by several edges. The members are edge indices, map them to the beam
+        of each edge before calling Frame.add_joint (truss_frame does this), or use the
+        connectivity with a BeamGroup, which needs no joints.
+    """
+    points = np.asarray(points, dtype=float)
+    edges = np.asarray(edges)
+    num_edges = edges.shape[0]
+    s = _spacing(num_nodes, spacing)
+
+    # merge coincident points
+    unique_points, point_index = np.unique(points, axis=0, return_inverse=True)
+    edges = point_index.ravel()[edges]
+
+    # the end nodes are the points, the interior nodes belong to one edge only
+    start_points = unique_points[edges[:, 0]]
+    end_points = unique_points[edges[:, 1]]
+    interior = start_points[:, None, :] + s[None, 1:-1, None] * (end_points - start_points)[:, None, :]
+
+    num_points = unique_points.shape[0]
+    connectivity = np.empty((num_edges, num_nodes), dtype=int)
+    connectivity[:, 0] = edges[:, 0]
+    connectivity[:, -1] = edges[:, 1]
+    connectivity[:, 1:-1] = num_points + np.arange(num_edges * (num_nodes - 2)).reshape(num_edges, num_nodes - 2)
+
+    # drop the unused points and compact the numbering
+    used, inverse = np.unique(connectivity, return_inverse=True)
+    nodes = np.vstack((unique_points, interior.reshape(-1, 3)))[used]
+    connectivity = inverse.reshape(num_edges, num_nodes)
+
+    # group the edge ends by point
+    end_points = np.concatenate((edges[:, 0], edges[:, 1]))
+    members = np.tile(np.arange(num_edges), 2)
+    local_nodes = np.repeat([0, num_nodes - 1], num_edges)
+
+    order = np.argsort(end_points, kind='stable')
+    groups, starts, counts = np.unique(end_points[order], return_index=True, return_counts=True)
+
+    joints = []
+    for start, count in zip(starts[counts > 1], counts[counts > 1]):
+        idx = order[start:start + count]
+        joints.append({'members': members[idx].tolist(), 'nodes': local_nodes[idx].tolist()})
     
-    # Loop through each edge to create the mesh
-    for i, (start_idx, end_idx) in enumerate(edges):
-        start_point = points[start_idx]
-        end_point = points[end_idx]
-        
-        # Create linspace for each coordinate
-        for j in range(3):
-            mesh_points[i, :, j] = np.linspace(start_point[j], end_point[j], num=num_nodes)
+    return nodes, connectivity, joints
+
+
+def truss_frame(frame, points, edges, num_nodes, material, cross_sections, spacing=None, name='member'):
+    """
+    Add one beam per edge of a truss/frame topology to a frame and join the beams at the shared points.
+
+    Parameters:
+    frame (af.Frame): The frame the beams and joints are added to.
+    points (numpy array): Array of shape (num_points, 3) containing the coordinates of the points.
+    edges (numpy array): Array of shape (num_edges, 2) containing the point connectivity.
+    num_nodes (int): The number of nodes to generate along each edge.
+    material (af.Material): The material of every beam.
+    cross_sections (list): One cross section per edge.
+    spacing (numpy array, optional): Array of shape (num_nodes,) of increasing positions along
+        each edge from 0 to 1, uniform by default.
+    name (str, optional): The beams are named f'{name}_{edge index}'.
+
+    Returns:
+    list: The beam of every edge, vertical edges use z=True and are meshed upward,
+        so edges listed top to bottom have their nodes (and the element values of
+        their cross sections) running from the lower point up.
+    """
+    import csdl_alpha as csdl
+    import aframe as af
+
+    if len(cross_sections) != len(edges):
+        raise ValueError("one cross section is needed per edge")
+
+    nodes, connectivity, joints = truss_mesh(points, edges, num_nodes, spacing)
+
+    beams, flipped = [], []
+    for i, (edge_nodes, cs) in enumerate(zip(connectivity, cross_sections)):
+        mesh = nodes[edge_nodes]
+        # the default orientation is undefined along the global z axis,
+        # z=True assumes the beam points up so downward edges are reversed
+        vertical = np.allclose(mesh[-1, :2], mesh[0, :2])
+        if vertical and mesh[-1, 2] < mesh[0, 2]:
+            mesh = mesh[::-1]
+            flipped.append(i)
+        beam = af.Beam(name=f'{name}_{i}', mesh=csdl.Variable(value=mesh), material=material, cs=cs, z=vertical)
+        frame.add_beam(beam)
+        beams.append(beam)
+
+    for joint in joints:
+        joint_nodes = [num_nodes - 1 - k if member in flipped else k for member, k in zip(joint['members'], joint['nodes'])]
+        frame.add_joint([beams[member] for member in joint['members']], joint_nodes)
+
+    return beams
+
+
+def _spacing(num_nodes, spacing=None):
+    # the positions along each edge, from 0 to 1
+    if spacing is None:
+        return np.linspace(0, 1, num_nodes)
     
-    return mesh_points
+    spacing = np.asarray(spacing, dtype=float)
+    if spacing.shape != (num_nodes,):
+        raise ValueError(f"spacing must have shape ({num_nodes},)")
+    
+    return spacing
 
 
 
@@ -40,3 +160,6 @@ if __name__ == '__main__':
 
     mesh = mesh_from_points_and_edges(points, edges, num_nodes)
     print(mesh)
+
+    nodes, connectivity, joints = truss_mesh(points, edges, num_nodes)
+    print(nodes.shape, joints)
@@ -0,0 +1,54 @@
+import csdl_alpha as csdl
+import numpy as np
+import aframe as af
+import time
+
+# solve time of a cantilever beam for increasing node counts
+# the dense solver is only run while the (dim, dim) matrices fit in memory
+node_counts = [20, 200, 2000, 20000]
+dense_limit = 500
+
+aluminum = af.Material(name='aluminum', E=69E9, G=26E9, density=2700)
+
+
+def cantilever(n, solver):
+
+    recorder = csdl.Recorder(inline=True)
+    recorder.start()
+
+    mesh = np.zeros((n, 3))
+    mesh[:, 1] = np.linspace(0, 10, n)
+    mesh = csdl.Variable(value=mesh)
+
+    loads = np.zeros((n, 6))
+    loads[:, 2] = 1
+    loads = csdl.Variable(value=loads)
+
+    radius = csdl.Variable(value=np.ones(n - 1) * 0.5)
+    thickness = csdl.Variable(value=np.ones(n - 1) * 0.001)
+    cs = af.CSTube(radius=radius, thickness=thickness)
+
+    beam = af.Beam(name='beam', mesh=mesh, material=aluminum, cs=cs)
+    beam.fix(0)
+    beam.add_load(loads)
+
+    frame = af.Frame(solver=solver)
+    frame.add_beam(beam)
+
+    t0 = time.perf_counter()
+    frame.solve()
+    t1 = time.perf_counter()
+
+    recorder.stop()
+
+    return t1 - t0
+
+
+print(f"{'nodes':>8} {'solver':>8} {'time (s)':>10}")
+for n in node_counts:
+    for solver in ['dense', 'sparse', 'banded']:
+        if solver == 'dense' and n > dense_limit:
+            continue
+
+        elapsed = cantilever(n, solver)
+        print(f"{n:>8} {solver:>8} {elapsed:>10.4f}")
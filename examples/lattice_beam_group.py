@@ -0,0 +1,59 @@
+import csdl_alpha as csdl
+import numpy as np
+import aframe as af
+from aframe.utils.meshing import truss_mesh
+import time
+
+# a cubic space-frame lattice built as one BeamGroup
+# (about 10k members for nx = ny = 15, nz = 12)
+nx, ny, nz = 15, 15, 12
+spacing = 1.0
+num_nodes = 3
+
+aluminum = af.Material(name='aluminum', E=69E9, G=26E9, density=2700)
+
+# the lattice points and the members along x, y and z
+i, j, k = np.meshgrid(np.arange(nx + 1), np.arange(ny + 1), np.arange(nz + 1), indexing='ij')
+index = (i * (ny + 1) + j) * (nz + 1) + k
+points = np.column_stack((i.ravel(), j.ravel(), k.ravel())) * spacing
+
+edges = np.vstack((
+    np.column_stack((index[:-1, :, :].ravel(), index[1:, :, :].ravel())),
+    np.column_stack((index[:, :-1, :].ravel(), index[:, 1:, :].ravel())),
+    np.column_stack((index[:, :, :-1].ravel(), index[:, :, 1:].ravel())),
+))
+
+t0 = time.perf_counter()
+nodes, connectivity, joints = truss_mesh(points, edges, num_nodes)
+t1 = time.perf_counter()
+
+recorder = csdl.Recorder(inline=True)
+recorder.start()
+
+num_elements = edges.shape[0] * (num_nodes - 1)
+radius = csdl.Variable(value=np.ones(num_elements) * 0.05)
+thickness = csdl.Variable(value=np.ones(num_elements) * 0.005)
+cs = af.CSTube(radius=radius, thickness=thickness)
+
+group = af.BeamGroup(name='lattice', mesh=csdl.Variable(value=nodes), connectivity=connectivity, material=aluminum, cs=cs)
+t2 = time.perf_counter()
+
+# fix the base and load the top
+for node in np.where(nodes[:, 2] == 0)[0]:
+    group.fix(node)
+
+loads = np.zeros((nodes.shape[0], 6))
+loads[nodes[:, 2] == nz * spacing, 0] = 100
+group.add_load(csdl.Variable(value=loads))
+
+# the block-Jacobi cg solver avoids the fill-in of a direct solve on a 3d lattice
+frame = af.Frame(solver='cg')
+frame.add_beam(group)
+frame.solve()
+t3 = time.perf_counter()
+
+recorder.stop()
+
+print(f"members: {edges.shape[0]}, nodes: {nodes.shape[0]}")
+print(f"mesh (s): {t1 - t0:.3f}, group (s): {t2 - t1:.3f}, solve (s): {t3 - t2:.3f}")
+print('max displacement:', np.max(np.abs(frame.displacement['lattice'].value)))
@@ -0,0 +1,215 @@
+import csdl_alpha as csdl
+import numpy as np
+import aframe as af
+import time
+
+# compare the sliced (one .set() per nonzero) and scattered
+# construction of the local stiffness/mass matrices
+
+
+def sliced_local_stiffness_matrices(beam:af.Beam)->csdl.Variable:
+    """
+    the reference construction with one .set() per nonzero,
+    Beam._local_stiffness_matrices() scatters the entries instead
+    """
+    A = beam.cs.area
+    E, G = beam.material.E, beam.material.G
+    Iz = beam.cs.iz
+    Iy = beam.cs.iy
+    J = beam.cs.ix
+    L = beam.lengths
+
+    local_stiffness = csdl.Variable(value=np.zeros((beam.num_elements, 12, 12)))
+
+    # pre-computations for speed
+    AEL = A*E/L
+    nAEL = -AEL
+    GJL = G*J/L
+    nGJL = -GJL
+
+    EIz = E*Iz
+    EIzL = EIz/L
+    EIzL2 = EIzL/L
+    EIzL3 = EIzL2/L
+    EIzL312 = 12*EIzL3
+    nEIzL312 = -EIzL312
+    EIzL26 = 6*EIzL2
+    nEIzL26 = -EIzL26
+    EIzL4 = 4*EIzL
+    EIzL2 = 2*EIzL
+
+    EIy = E*Iy
+    EIyL = EIy/L
+    EIyL2 = EIyL/L
+    EIyL3 = EIyL2/L
+    EIyL26 = 6*EIyL2
+    nEIyL26 = -EIyL26
+    EIyL312 = 12*EIyL3
+    nEIyL312 = -EIyL312
+    EIyL4 = 4*EIyL
+    EIyL2 = 2*EIyL
+
+    local_stiffness = local_stiffness.set(csdl.slice[:, 0, 0], AEL)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 1, 1], EIzL312)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 1, 5], EIzL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 5, 1], EIzL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 2, 2], EIyL312)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 2, 4], nEIyL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 4, 2], nEIyL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 3, 3], GJL)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 4, 4], EIyL4)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 5, 5], EIzL4)
+
+    local_stiffness = local_stiffness.set(csdl.slice[:, 0, 6], nAEL)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 1, 7], nEIzL312)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 1, 11], EIzL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 2, 8], nEIyL312)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 2, 10], nEIyL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 3, 9], nGJL)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 4, 8], EIyL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 4, 10], EIyL2)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 5, 7], nEIzL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 5, 11], EIzL2)
+
+    local_stiffness = local_stiffness.set(csdl.slice[:, 6, 0], nAEL)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 7, 1], nEIzL312)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 7, 5], nEIzL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 8, 2], nEIyL312)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 8, 4], EIyL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 9, 3], nGJL)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 10, 2], nEIyL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 10, 4], EIyL2)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 11, 1], EIzL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 11, 5], EIzL2)
+
+    local_stiffness = local_stiffness.set(csdl.slice[:, 6, 6], AEL)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 7, 7], EIzL312)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 7, 11], nEIzL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 11, 7], nEIzL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 8, 8], EIyL312)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 8, 10], EIyL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 10, 8], EIyL26)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 9, 9], GJL)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 10, 10], EIyL4)
+    local_stiffness = local_stiffness.set(csdl.slice[:, 11, 11], EIzL4)
+
+
+    return local_stiffness
+
+
+def sliced_local_mass_matrices(beam:af.Beam)->csdl.Variable:
+    """
+    the reference construction with one .set() per nonzero,
+    Beam._local_mass_matrices() scatters the entries instead
+    """
+    A = beam.cs.area
+    rho = beam.material.density
+    J = beam.cs.ix
+    L = beam.lengths
+
+    # coefficients
+    aa = L / 2
+    aa2 = aa**2
+    coef = rho * A * aa / 105
+    coef70 = coef * 70
+    coef78 = coef * 78
+    coef35 = coef * 35
+    ncoef35 = -coef35
+    coef27 = coef * 27
+    coef22aa = coef * 22 * aa
+    ncoef22aa = -coef22aa
+    coef13aa = coef * 13 * aa
+    ncoef13aa = -coef13aa
+    coef8aa2 = coef * 8 * aa2
+    ncoef6aa2 = -coef * 6 * aa2
+    rx2 = J / A
+    ncoef35rx2 = ncoef35 * rx2
+
+    local_mass = csdl.Variable(value=np.zeros((beam.num_elements, 12, 12)))
+
+    local_mass = local_mass.set(csdl.slice[:, 0, 0], coef70)
+    local_mass = local_mass.set(csdl.slice[:, 1, 1], coef78)
+    local_mass = local_mass.set(csdl.slice[:, 2, 2], coef78)
+    local_mass = local_mass.set(csdl.slice[:, 3, 3], coef78 * rx2)
+    local_mass = local_mass.set(csdl.slice[:, 2, 4], ncoef22aa)
+    local_mass = local_mass.set(csdl.slice[:, 4, 2], ncoef22aa)
+    local_mass = local_mass.set(csdl.slice[:, 4, 4], coef8aa2)
+    local_mass = local_mass.set(csdl.slice[:, 1, 5], coef22aa)
+    local_mass = local_mass.set(csdl.slice[:, 5, 1], coef22aa)
+    local_mass = local_mass.set(csdl.slice[:, 5, 5], coef8aa2)
+    local_mass = local_mass.set(csdl.slice[:, 0, 6], coef35)
+    local_mass = local_mass.set(csdl.slice[:, 6, 0], coef35)
+    local_mass = local_mass.set(csdl.slice[:, 6, 6], coef70)
+    local_mass = local_mass.set(csdl.slice[:, 1, 7], coef27)
+    local_mass = local_mass.set(csdl.slice[:, 7, 1], coef27)
+    local_mass = local_mass.set(csdl.slice[:, 5, 7], coef13aa)
+    local_mass = local_mass.set(csdl.slice[:, 7, 5], coef13aa)
+    local_mass = local_mass.set(csdl.slice[:, 7, 7], coef78)
+    local_mass = local_mass.set(csdl.slice[:, 2, 8], coef27)
+    local_mass = local_mass.set(csdl.slice[:, 8, 2], coef27)
+    local_mass = local_mass.set(csdl.slice[:, 4, 8], ncoef13aa)
+    local_mass = local_mass.set(csdl.slice[:, 8, 4], ncoef13aa)
+    local_mass = local_mass.set(csdl.slice[:, 8, 8], coef78)
+    local_mass = local_mass.set(csdl.slice[:, 3, 9], ncoef35rx2)
+    local_mass = local_mass.set(csdl.slice[:, 9, 3], ncoef35rx2)
+    local_mass = local_mass.set(csdl.slice[:, 9, 9], coef70 * rx2)
+    local_mass = local_mass.set(csdl.slice[:, 2, 10], coef13aa)
+    local_mass = local_mass.set(csdl.slice[:, 10, 2], coef13aa)
+    local_mass = local_mass.set(csdl.slice[:, 4, 10], ncoef6aa2)
+    local_mass = local_mass.set(csdl.slice[:, 10, 4], ncoef6aa2)
+    local_mass = local_mass.set(csdl.slice[:, 8, 10], coef22aa)
+    local_mass = local_mass.set(csdl.slice[:, 10, 8], coef22aa)
+    local_mass = local_mass.set(csdl.slice[:, 10, 10], coef8aa2)
+    local_mass = local_mass.set(csdl.slice[:, 1, 11], ncoef13aa)
+    local_mass = local_mass.set(csdl.slice[:, 11, 1], ncoef13aa)
+    local_mass = local_mass.set(csdl.slice[:, 5, 11], ncoef6aa2)
+    local_mass = local_mass.set(csdl.slice[:, 11, 5], ncoef6aa2)
+    local_mass = local_mass.set(csdl.slice[:, 7, 11], ncoef22aa)
+    local_mass = local_mass.set(csdl.slice[:, 11, 7], ncoef22aa)
+    local_mass = local_mass.set(csdl.slice[:, 11, 11], coef8aa2)
+
+
+    return local_mass
+
+
+n = 1001
+
+aluminum = af.Material(name='aluminum', E=69E9, G=26E9, density=2700)
+
+recorder = csdl.Recorder(inline=True)
+recorder.start()
+
+mesh = np.zeros((n, 3))
+mesh[:, 1] = np.linspace(0, 10, n)
+mesh = csdl.Variable(value=mesh)
+
+radius = csdl.Variable(value=np.ones(n - 1) * 0.5)
+thickness = csdl.Variable(value=np.ones(n - 1) * 0.001)
+cs = af.CSTube(radius=radius, thickness=thickness)
+
+beam = af.Beam(name='beam', mesh=mesh, material=aluminum, cs=cs)
+
+methods = {
+    'sliced': (lambda: sliced_local_stiffness_matrices(beam), lambda: sliced_local_mass_matrices(beam)),
+    'scattered': (beam._local_stiffness_matrices, beam._local_mass_matrices),
+}
+
+print(f"{'method':>10} {'graph nodes':>12} {'build (s)':>10} {'derivative (s)':>15}")
+for name, (stiffness, mass) in methods.items():
+    nodes_0 = len(recorder.active_graph.node_table)
+
+    t0 = time.perf_counter()
+    local_stiffness = stiffness()
+    local_mass = mass()
+    t1 = time.perf_counter()
+
+    nodes_1 = len(recorder.active_graph.node_table)
+
+    total = csdl.sum(local_stiffness) + csdl.sum(local_mass)
+    t2 = time.perf_counter()
+    csdl.derivative(total, radius)
+    t3 = time.perf_counter()
+
+    print(f"{name:>10} {nodes_1 - nodes_0:>12} {t1 - t0:>10.4f} {t3 - t2:>15.4f}")
+
+recorder.stop()
@@ -0,0 +1,215 @@
+import pytest
+import numpy as np
+
+pytest.importorskip('csdl_alpha')
+from aframe.utils.aeroelastic_utils import NodalMap, AeroelasticCoupling
+
+
+@pytest.fixture
+def meshes():
+    rng = np.random.default_rng(0)
+    return rng.random((30, 3)) * 10, rng.random((50, 3)) * 10
+
+
+def brute_force(mesh_in, mesh_out, method, k=None, radius=None):
+    # the dense (m, n) weights from every pairwise distance
+    d = np.linalg.norm(mesh_out[:, None] - mesh_in[None], axis=2)
+    if method == 'rbf':
+        w = np.exp(-d**2)
+    elif method == 'idw':
+        w = 1 / d**2
+    else:
+        w = np.clip(1 - d / radius, 0, None)**4 * (4 * d / radius + 1)
+
+    if k is not None:
+        far = np.argsort(d, axis=1)[:, k:]
+        np.put_along_axis(w, far, 0, axis=1)
+    if radius is not None:
+        w[d > radius] = 0
+
+    # output points without any neighbours are not moved
+    sums = w.sum(axis=1, keepdims=True)
+    return w / np.where(sums == 0, 1, sums)
+
+
+@pytest.mark.parametrize('kwargs', [dict(method='rbf'), 
+                                    dict(method='rbf', k=6), 
+                                    dict(method='idw', k=5), 
+                                    dict(method='idw', k=5, radius=3), 
+                                    dict(method='wendland', radius=8)])
+def test_sparse_weights(meshes, kwargs):
+    '''
+    Test description: the KD-tree neighbours give the same weights
+    as the dense pairwise distances, and batched values map like
+    every step on its own.
+    '''
+    mesh_in, mesh_out = meshes
+    nodal_map = NodalMap(mesh_in, mesh_out, **kwargs)
+
+    np.testing.assert_allclose(nodal_map.matrix.toarray(), brute_force(mesh_in, mesh_out, **kwargs), atol=1E-12)
+
+    values = np.random.default_rng(3).random((4, 30, 3))
+    batched = nodal_map.evaluate(values)
+    for i in range(4):
+        np.testing.assert_allclose(batched[i], nodal_map.evaluate(values[i]))
+
+
+def test_coincident_meshes(meshes):
+    '''
+    Test description: the displacements of coincident nodes are copied.
+    '''
+    mesh_in, _ = meshes
+    nodal_map = NodalMap(mesh_in, mesh_in, method='idw', k=4)
+    displacement = np.random.default_rng(2).random((30, 3))
+
+    np.testing.assert_allclose(nodal_map.evaluate(displacement), mesh_in + displacement, atol=1E-10)
+
+
+@pytest.mark.parametrize('kwargs', [dict(method='rbf'), 
+                                    dict(method='idw', k=5), 
+                                    dict(method='wendland', radius=8)])
+def test_load_transfer_conservation(meshes, kwargs):
+    '''
+    Test description: the transferred loads keep the total force, the total
+    moment and the virtual work of the forces on the output mesh.
+    '''
+    mesh_in, mesh_out = meshes
+    nodal_map = NodalMap(mesh_in, mesh_out, **kwargs)
+    # every output point is reached, compact support kernels need a large enough radius
+    np.testing.assert_allclose(nodal_map.matrix.sum(axis=1), 1)
+    rng = np.random.default_rng(1)
+    forces = rng.standard_normal((50, 3))
+
+    loads = nodal_map.transfer_loads(forces)
+
+    np.testing.assert_allclose(loads[:, :3].sum(axis=0), forces.sum(axis=0), atol=1E-10)
+    moment = (np.cross(mesh_in, loads[:, :3]) + loads[:, 3:]).sum(axis=0)
+    np.testing.assert_allclose(moment, np.cross(mesh_out, forces).sum(axis=0), atol=1E-9)
+
+    u = rng.standard_normal((30, 3))
+    np.testing.assert_allclose(np.sum((nodal_map.matrix @ u) * forces), np.sum(u * loads[:, :3]), rtol=1E-10)
+
+
+def test_load_transfer_variable(meshes):
+    '''
+    Test description: csdl forces are transferred like numpy forces.
+    '''
+    import csdl_alpha as csdl
+
+    recorder = csdl.Recorder(inline=True)
+    recorder.start()
+
+    mesh_in, mesh_out = meshes
+    nodal_map = NodalMap(mesh_in, mesh_out, method='idw', k=5)
+    forces = np.random.default_rng(4).standard_normal((50, 3))
+    loads = nodal_map.transfer_loads(csdl.Variable(value=forces))
+
+    recorder.stop()
+
+    np.testing.assert_allclose(loads.value, nodal_map.transfer_loads(forces))
+
+
+class Resolve:
+    '''
+    stands in for recorder.execute(), re-solving the frame with the current load values
+    '''
+    def __init__(self, frame):
+        self.frame = frame
+
+    def execute(self):
+        self.frame.solve()
+
+
+def coupled_beam(cache_size=4):
+    # a cantilever under a lift that grows with the deflection of a 40 point aero mesh
+    import csdl_alpha as csdl
+    import aframe as af
+
+    n = 21
+    mesh = np.zeros((n, 3))
+    mesh[:, 1] = np.linspace(0, 10, n)
+    aluminum = af.Material(name='aluminum', E=69E9, G=26E9, density=2700)
+    cs = af.CSTube(radius=csdl.Variable(value=np.ones(n - 1) * 0.2), 
+                   thickness=csdl.Variable(value=np.ones(n - 1) * 0.005))
+    beam = af.Beam(name='beam', mesh=csdl.Variable(value=mesh), material=aluminum, cs=cs)
+    beam.fix(0)
+    loads = csdl.Variable(value=np.zeros((n, 6)))
+    beam.add_load(loads)
+
+    frame = af.Frame(solver='sparse', cache_size=cache_size)
+    frame.add_beam(beam)
+    frame.solve()
+
+    aero_mesh = np.zeros((40, 3))
+    aero_mesh[:, 0] = 0.3
+    aero_mesh[:, 1] = np.linspace(0, 10, 40)
+    nodal_map = NodalMap(mesh, aero_mesh, method='idw', k=4)
+
+    return frame, [(beam, loads, nodal_map)]
+
+
+def lift(meshes):
+    forces = []
+    for mesh in meshes:
+        force = np.zeros_like(mesh)
+        force[:, 2] = 2000 * (1 + 3 * mesh[:, 2])
+        forces.append(force)
+
+    return forces
+
+
+@pytest.fixture
+def recorder():
+    import csdl_alpha as csdl
+
+    recorder = csdl.Recorder(inline=True)
+    recorder.start()
+    yield recorder
+    recorder.stop()
+
+
+def test_coupling_convergence(recorder):
+    '''
+    Test description: the aitken and anderson relaxations converge to the
+    same fixed point, where the loads are the transfer of the aero forces
+    on the deformed aero mesh.
+    '''
+    tips = []
+    for relaxation in ('aitken', 'anderson'):
+        frame, components = coupled_beam()
+        coupling = AeroelasticCoupling(Resolve(frame), frame, components, lift, relaxation=relaxation, omega=0.5)
+        loads, = coupling.solve()
+
+        assert coupling.converged
+        assert coupling.history[-1] < 1E-8 < coupling.history[0]
+        assert len(coupling.history) < coupling.maxiter
+
+        beam, _, nodal_map = components[0]
+        mesh = nodal_map.evaluate(frame.displacement[beam.name].value)
+        np.testing.assert_allclose(loads, nodal_map.transfer_loads(lift([mesh])[0]), rtol=1E-6, atol=1E-6 * np.abs(loads).max())
+        tips.append(frame.displacement[beam.name].value[-1])
+
+    np.testing.assert_allclose(tips[1], tips[0], rtol=1E-6, atol=1E-9)
+
+
+def test_coupling_maxiter(recorder):
+    '''
+    Test description: the coupling stops at maxiter without converging.
+    '''
+    frame, components = coupled_beam()
+    coupling = AeroelasticCoupling(Resolve(frame), frame, components, lift, relaxation='constant', maxiter=3)
+    coupling.solve()
+
+    assert not coupling.converged
+    assert len(coupling.history) == 3
+
+
+def test_coupling_needs_cache(recorder):
+    '''
+    Test description: a direct solver without a factorization cache is rejected.
+    '''
+    frame, components = coupled_beam(cache_size=None)
+    with pytest.raises(ValueError):
+        AeroelasticCoupling(Resolve(frame), frame, components, lift)
+    with pytest.raises(ValueError):
+        AeroelasticCoupling(Resolve(frame), coupled_beam()[0], components, lift, relaxation='newton')
@@ -0,0 +1,113 @@
+import pytest
+import numpy as np
+
+csdl = pytest.importorskip('csdl_alpha')
+import aframe as af
+from aframe.utils.meshing import truss_mesh
+
+
+@pytest.fixture(autouse=True)
+def recorder():
+    recorder = csdl.Recorder(inline=True)
+    recorder.start()
+    yield recorder
+    recorder.stop()
+
+
+aluminum = af.Material(name='aluminum', E=69E9, G=26E9, density=2700)
+
+# a two storey tower, vertical columns with diagonals and horizontals on every storey
+points = np.array([(x, y, 1.5 * k) for k in range(3) for x, y in [(0, 0), (1, 0), (1, 1), (0, 1)]], dtype=float)
+edges = np.array([edge for k in range(2) for i in range(4)
+                  for edge in [(4 * k + i, 4 * (k + 1) + i),
+                               (4 * k + i, 4 * (k + 1) + (i + 1) % 4),
+                               (4 * (k + 1) + i, 4 * (k + 1) + (i + 1) % 4)]])
+num_nodes = 4
+nodes, connectivity, joints = truss_mesh(points, edges, num_nodes)
+num_elements = len(edges) * (num_nodes - 1)
+
+# the base is fixed and the top corners carry a lateral and a vertical load
+base = np.where(nodes[:, 2] == 0)[0]
+loads = np.zeros((len(nodes), 6))
+top = np.where(nodes[:, 2] == 3)[0]
+top = top[np.isin(top, connectivity[:, [0, -1]])]
+loads[top, 0] = 1E4
+loads[top, 2] = -2E4
+
+
+def tube(n):
+    return af.CSTube(radius=csdl.Variable(value=np.ones(n) * 0.05),
+                     thickness=csdl.Variable(value=np.ones(n) * 0.005))
+
+
+def tower_group(mesh, solver='sparse'):
+    group = af.BeamGroup('group', mesh, connectivity, aluminum, tube(num_elements))
+    for node in base:
+        group.fix(node)
+    group.add_load(csdl.Variable(value=loads))
+
+    frame = af.Frame(solver=solver)
+    frame.add_beam(group)
+    frame.solve()
+
+    return frame.displacement['group']
+
+
+@pytest.mark.parametrize('solver', ['dense', 'sparse', 'banded'])
+def test_group_matches_beams(solver):
+    '''
+    Test description: a BeamGroup deflects like the same members
+    as individual beams connected by joints.
+    '''
+    frame = af.Frame()
+    beams = []
+    loaded = set()
+    for i, member in enumerate(connectivity):
+        mesh = nodes[member]
+        beam = af.Beam(name=f'member_{i}', mesh=csdl.Variable(value=mesh), material=aluminum,
+                       cs=tube(num_nodes - 1), z=np.allclose(mesh[0, :2], mesh[-1, :2]))
+        beam_loads = np.zeros((num_nodes, 6))
+        for k, node in enumerate(member):
+            if node in base:
+                beam.fix(k)
+            if node not in loaded:
+                beam_loads[k] = loads[node]
+                loaded.add(node)
+        beam.add_load(csdl.Variable(value=beam_loads))
+        frame.add_beam(beam)
+        beams.append(beam)
+
+    for joint in joints:
+        frame.add_joint([beams[member] for member in joint['members']], joint['nodes'])
+    frame.solve()
+
+    displacement = tower_group(csdl.Variable(value=nodes), solver).value
+
+    for beam, member in zip(beams, connectivity):
+        np.testing.assert_allclose(displacement[member], frame.displacement[beam.name].value,
+                                   rtol=1E-8, atol=1E-10 * np.abs(displacement).max())
+
+
+def test_group_recorded_gradient():
+    '''
+    Test description: the gradient of the top displacements with respect
+    to the mesh is finite on the vertical members and matches finite
+    differences of the node heights, which keep the columns vertical.
+    '''
+    mesh = csdl.Variable(value=nodes)
+    # the sum of the lateral top displacements
+    mask = np.zeros(nodes.shape)
+    mask[top, 0] = 1
+    objective = csdl.sum(tower_group(mesh) * mask)
+    gradient = csdl.derivative(objective, mesh).value.reshape(nodes.shape)
+
+    assert np.all(np.isfinite(gradient))
+
+    h = 1E-6
+    # an interior column node, an interior diagonal node and a top corner
+    for node in (connectivity[0, 1], connectivity[1, 2], top[0]):
+        step = np.zeros(nodes.shape)
+        step[node, 2] = h
+        plus = tower_group(csdl.Variable(value=nodes + step)).value[top, 0].sum()
+        minus = tower_group(csdl.Variable(value=nodes - step)).value[top, 0].sum()
+        np.testing.assert_allclose(gradient[node, 2], (plus - minus) / (2 * h), rtol=1E-5)
@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+
+csdl = pytest.importorskip('csdl_alpha')
+import aframe as af
+
+
+@pytest.fixture(autouse=True)
+def recorder():
+    recorder = csdl.Recorder(inline=True)
+    recorder.start()
+    yield recorder
+    recorder.stop()
+
+
+def tube(start, end, n=21):
+    '''
+    a uniform tube between two points, solved in its own frame
+    '''
+    mesh = np.linspace(start, end, n)
+    aluminum = af.Material(name='aluminum', E=69E9, G=26E9, density=2700)
+    cs = af.CSTube(radius=csdl.Variable(value=np.ones(n - 1) * 0.5),
+                   thickness=csdl.Variable(value=np.ones(n - 1) * 0.01))
+    beam = af.Beam(name='beam', mesh=csdl.Variable(value=mesh), material=aluminum, cs=cs, 
+                   z=np.allclose(start[:2], end[:2]))
+    beam.fix(0)
+    frame = af.Frame()
+    frame.add_beam(beam)
+    frame.solve()
+
+    return frame, cs
+
+
+@pytest.mark.parametrize('direction', [np.array([0, 1, 0]), 
+                                       np.array([1, 1, 1]) / np.sqrt(3), 
+                                       np.array([0, 0, 1])])
+def test_tube_inertia(direction):
+    '''
+    Test description: the mass, cg and inertia tensor about the cg of an
+    offset uniform tube match the slender rod with its section inertia.
+    '''
+    start = np.array([1., -2., 3.])
+    length = 10
+    frame, cs = tube(start, start + length * direction)
+
+    rho = 2700
+    mass = rho * cs.area.value[0] * length
+    transverse = mass * length**2 / 12 + rho * length * cs.iy.value[0]
+    axial = rho * length * (cs.iy.value[0] + cs.iz.value[0])
+    expected = transverse * (np.eye(3) - np.outer(direction, direction)) + axial * np.outer(direction, direction)
+
+    np.testing.assert_allclose(frame.mass.value, mass, rtol=1E-12)
+    np.testing.assert_allclose(frame.cg.value, start + length / 2 * direction, atol=1E-12)
+    np.testing.assert_allclose(frame.inertia.value, expected, atol=1E-9 * transverse)
+
+    rigid_body_mass = frame.rigid_body_mass.value
+    np.testing.assert_allclose(rigid_body_mass[:3, :3], mass * np.eye(3), rtol=1E-12)
+    np.testing.assert_allclose(rigid_body_mass[3:, 3:], frame.inertia.value)
+    np.testing.assert_allclose(rigid_body_mass[:3, 3:], 0)
@@ -0,0 +1,102 @@
+import pytest
+import numpy as np
+
+pytest.importorskip('csdl_alpha')
+from aframe.utils.meshing import mesh_from_points_and_edges, truss_mesh, truss_frame
+
+
+# a square pyramid, the base points are shared by three edges
+points = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [0.5, 0.5, 1]])
+edges = np.array([[0, 1], [1, 2], [2, 3], [3, 0], [0, 4], [1, 4], [2, 4], [3, 4]])
+
+
+def test_truss_mesh():
+    '''
+    Test description: the shared-node mesh reproduces the per-edge meshes
+    and merges the edge ends at the points.
+    '''
+    num_nodes = 4
+    nodes, connectivity, joints = truss_mesh(points, edges, num_nodes)
+
+    np.testing.assert_allclose(nodes[connectivity], mesh_from_points_and_edges(points, edges, num_nodes))
+    assert nodes.shape == (len(points) + len(edges) * (num_nodes - 2), 3)
+
+    # one joint per point, every member end in a joint sits on the same node
+    assert len(joints) == len(points)
+    for joint in joints:
+        assert len(set(connectivity[joint['members'], joint['nodes']].tolist())) == 1
+
+
+def test_truss_mesh_duplicate_points():
+    '''
+    Test description: coincident points are merged.
+    '''
+    duplicated = np.vstack((points, points[:1]))
+    merged_edges = edges.copy()
+    merged_edges[0, 0] = len(points)
+
+    nodes, connectivity, joints = truss_mesh(duplicated, merged_edges, 3)
+    reference = truss_mesh(points, edges, 3)
+
+    np.testing.assert_allclose(nodes[connectivity], reference[0][reference[1]])
+    assert nodes.shape == reference[0].shape
+
+
+def test_truss_frame_downward_edge():
+    '''
+    Test description: a portal frame with a column listed top to bottom
+    deflects like the same members in a BeamGroup.
+    '''
+    import csdl_alpha as csdl
+    import aframe as af
+
+    recorder = csdl.Recorder(inline=True)
+    recorder.start()
+
+    portal = np.array([[0, 0, 0], [0, 0, 3], [4, 0, 3], [4, 0, 0]])
+    # the first column is listed downward
+    portal_edges = np.array([[1, 0], [1, 2], [3, 2]])
+    num_nodes = 5
+    steel = af.Material(name='steel', E=200E9, G=80E9, density=7850)
+    nodes, connectivity, _ = truss_mesh(portal, portal_edges, num_nodes)
+    # a lateral and a vertical load on the top corners
+    loads = np.zeros((len(nodes), 6))
+    loads[connectivity[1, [0, -1]], 0] = 1E4
+    loads[connectivity[1, [0, -1]], 2] = -2E4
+    base = np.where(nodes[:, 2] == 0)[0]
+
+    def tube(n):
+        return af.CSTube(radius=csdl.Variable(value=np.ones(n) * 0.05), 
+                         thickness=csdl.Variable(value=np.ones(n) * 0.005))
+
+    frame = af.Frame()
+    beams = truss_frame(frame, portal, portal_edges, num_nodes, steel, [tube(num_nodes - 1) for _ in portal_edges])
+    # the mesh nodes of each beam, the loads go on the first beam at a node
+    beam_nodes = [np.argmin(np.linalg.norm(beam.mesh.value[:, None] - nodes[None], axis=2), axis=1) for beam in beams]
+    loaded = set()
+    for beam, global_nodes in zip(beams, beam_nodes):
+        beam_loads = np.zeros((num_nodes, 6))
+        for k, node in enumerate(global_nodes):
+            if node in base:
+                beam.fix(k)
+            if node not in loaded:
+                beam_loads[k] = loads[node]
+                loaded.add(node)
+        beam.add_load(csdl.Variable(value=beam_loads))
+    frame.solve()
+
+    group = af.BeamGroup('group', csdl.Variable(value=nodes), connectivity, steel, tube(len(portal_edges) * (num_nodes - 1)))
+    for node in base:
+        group.fix(node)
+    group.add_load(csdl.Variable(value=loads))
+    group_frame = af.Frame()
+    group_frame.add_beam(group)
+    group_frame.solve()
+
+    recorder.stop()
+
+    assert beams[0].z and beams[0].mesh.value[0, 2] == 0
+    expected = group_frame.displacement['group'].value
+    for beam, global_nodes in zip(beams, beam_nodes):
+        np.testing.assert_allclose(frame.displacement[beam.name].value, expected[global_nodes], 
+                                   rtol=1E-8, atol=1E-10 * np.abs(expected).max())
@@ -0,0 +1,47 @@
+import pytest
+import numpy as np
+import scipy.linalg as sla
+
+csdl = pytest.importorskip('csdl_alpha')
+import aframe as af
+
+
+@pytest.fixture(autouse=True)
+def recorder():
+    recorder = csdl.Recorder(inline=True)
+    recorder.start()
+    yield recorder
+    recorder.stop()
+
+
+def test_modes():
+    '''
+    Test description: the frame frequencies match a dense generalized
+    eigenvalue solve of the constrained system.
+    '''
+    n = 21
+    mesh = np.zeros((n, 3))
+    mesh[:, 1] = np.linspace(0, 10, n)
+    aluminum = af.Material(name='aluminum', E=69E9, G=26E9, density=2700)
+
+    def cantilever():
+        cs = af.CSTube(radius=csdl.Variable(value=np.ones(n - 1) * 0.5),
+                       thickness=csdl.Variable(value=np.ones(n - 1) * 0.01))
+        beam = af.Beam(name='beam', mesh=csdl.Variable(value=mesh), material=aluminum, cs=cs)
+        beam.fix(0)
+        frame = af.Frame()
+        frame.add_beam(beam)
+        return frame
+
+    frame = cantilever()
+    zeros = csdl.Variable(value=np.zeros(n * 6))
+    frame.dynamic_residual(zeros, zeros, zeros)
+    free = frame.free
+    K = frame.K.value[np.ix_(free, free)]
+    M = frame.M.value[np.ix_(free, free)]
+    expected = np.sqrt(sla.eigh(K, M, eigvals_only=True, subset_by_index=[0, 5])) / (2 * np.pi)
+
+    frequencies, mode_shapes = cantilever().modes(6)
+
+    np.testing.assert_allclose(frequencies.value, expected, rtol=1E-8)
+    assert mode_shapes['beam'].value.shape == (6, n, 3)
@@ -0,0 +1,55 @@
+import pytest
+import numpy as np
+import scipy.sparse as sp
+from scipy.integrate import solve_ivp
+
+pytest.importorskip('csdl_alpha')
+import aframe as af
+
+
+# a damped single degree of freedom system, u'' + 0.2 u' + 4 u = cos(t)
+M = np.eye(1)
+K = 4 * np.eye(1)
+C = 0.2 * np.eye(1)
+f = lambda t: np.array([np.cos(t)])
+
+
+def reference(t):
+    ode = lambda t, y: [y[1], np.cos(t) - 0.2 * y[1] - 4 * y[0]]
+    return solve_ivp(ode, (0, t), [1, 0], rtol=1E-12, atol=1E-12).y[0, -1]
+
+
+@pytest.mark.parametrize('method, kwargs', [(af.newmark, {}), 
+                                            (af.hht_alpha, {}), 
+                                            (af.hht_alpha, dict(alpha=-0.3))])
+def test_second_order_convergence(method, kwargs):
+    '''
+    Test description: halving the time step divides the error by four.
+    '''
+    expected = reference(10)
+    errors = []
+    for n in (201, 401, 801):
+        u, v, a = method(M, K, C, f, np.ones(1), np.zeros(1), np.linspace(0, 10, n), **kwargs)
+        errors.append(abs(u[-1, 0] - expected))
+
+    rates = np.log2(np.array(errors[:-1]) / np.array(errors[1:]))
+    assert np.all(rates > 1.9)
+
+
+def test_sparse_matrices():
+    '''
+    Test description: sparse and dense matrices give the same history.
+    '''
+    t = np.linspace(0, 10, 101)
+    dense = af.hht_alpha(M, K, C, f, np.ones(1), np.zeros(1), t)[0]
+    sparse = af.hht_alpha(sp.csr_matrix(M), sp.csr_matrix(K), sp.csr_matrix(C), f, np.ones(1), np.zeros(1), t)[0]
+
+    np.testing.assert_allclose(sparse, dense, rtol=1E-12)
+
+
+def test_invalid_alpha():
+    '''
+    Test description: alpha outside [-1/3, 0] is rejected.
+    '''
+    with pytest.raises(ValueError):
+        af.hht_alpha(M, K, C, f, np.ones(1), np.zeros(1), np.linspace(0, 1, 11), alpha=0.1)
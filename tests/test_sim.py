@@ -0,0 +1,205 @@
+import pytest
+import numpy as np
+import scipy.linalg as sla
+
+pytest.importorskip('csdl_alpha')
+from aframe.core.sim import Simulation
+
+
+class Value:
+    def __init__(self, value):
+        self.value = value
+
+
+class Solution:
+    '''
+    a two degree of freedom spring-mass system
+    '''
+    def __init__(self):
+        self.M = Value(np.diag([2., 1.]))
+        self.K = Value(np.array([[3E5, -1E5], [-1E5, 1E5]]))
+        self.F = Value(np.array([0., 10.]))
+        self.u0 = Value(np.zeros(2))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 100])
+def test_stream_matches_solve(chunk_size):
+    '''
+    Test description: the streamed chunks reproduce solve(),
+    including chunks that hold a single time point.
+    '''
+    sim = Simulation(Solution(), 0, 0.01, 11)
+    t, u = sim.solve()
+
+    chunks = list(sim.stream(chunk_size=chunk_size))
+    t_stream = np.concatenate([chunk[0] for chunk in chunks])
+    u_stream = np.concatenate([chunk[1] for chunk in chunks], axis=1)
+
+    assert len(chunks) == int(np.ceil(11 / chunk_size))
+    np.testing.assert_allclose(t_stream, t)
+    np.testing.assert_allclose(u_stream, u, atol=1E-2 * np.abs(u).max())
+
+
+def test_mass_factor():
+    '''
+    Test description: the ode applies M^-1 without forming M^-1 K,
+    and a lumped mass keeps the jacobian as sparse as K.
+    '''
+    solution = Solution()
+    sim = Simulation(solution, 0, 0.01, 11)
+    M, K, F = solution.M.value, solution.K.value, solution.F.value
+
+    y = np.array([1E-3, -2E-3, 0.5, 0.25])
+    expected = np.concatenate((y[2:], np.linalg.solve(M, F * np.cos(900 * 0.1) - K @ y[:2])))
+    np.testing.assert_allclose(sim._ode(0.1, y), expected)
+    assert sim.jac.nnz == 2 + np.count_nonzero(K)
+    np.testing.assert_allclose(sim.jac.toarray()[2:, :2], -np.linalg.solve(M, K))
+
+    # a consistent mass gives the same ode
+    solution.M = Value(np.array([[2., 0.5], [0.5, 1.]]))
+    sim = Simulation(solution, 0, 0.01, 11)
+    M = solution.M.value
+    expected = np.concatenate((y[2:], np.linalg.solve(M, F * np.cos(900 * 0.1) - K @ y[:2])))
+    np.testing.assert_allclose(sim._ode(0.1, y), expected)
+    np.testing.assert_allclose(sim.jac.toarray()[2:, :2], -np.linalg.solve(M, K))
+
+
+def cantilever(solver='dense', n=11):
+    '''
+    a tip-loaded cantilever after dynamic_residual, inside a started recorder
+    '''
+    import csdl_alpha as csdl
+    import aframe as af
+
+    mesh = np.zeros((n, 3))
+    mesh[:, 1] = np.linspace(0, 10, n)
+    aluminum = af.Material(name='aluminum', E=69E9, G=26E9, density=2700)
+    loads = np.zeros((n, 6))
+    loads[:, 2] = 1E3
+
+    cs = af.CSTube(radius=csdl.Variable(value=np.ones(n - 1) * 0.5), 
+                   thickness=csdl.Variable(value=np.ones(n - 1) * 0.01))
+    beam = af.Beam(name='beam', mesh=csdl.Variable(value=mesh), material=aluminum, cs=cs)
+    beam.fix(0)
+    beam.add_load(csdl.Variable(value=loads))
+
+    frame = af.Frame(solver=solver)
+    frame.add_beam(beam)
+    zeros = csdl.Variable(value=np.zeros(n * 6))
+    frame.dynamic_residual(zeros, zeros, zeros)
+
+    return frame, beam
+
+
+@pytest.fixture
+def recorder():
+    import csdl_alpha as csdl
+
+    recorder = csdl.Recorder(inline=True)
+    recorder.start()
+    yield recorder
+    recorder.stop()
+
+
+def test_frame_solution(recorder):
+    '''
+    Test description: a Frame can be passed to Simulation after
+    dynamic_residual, with the COO data of the sparse modes
+    giving the same displacements as the dense matrices.
+    '''
+    displacements = []
+    for solver in ('dense', 'sparse'):
+        frame, _ = cantilever(solver)
+        t, u = Simulation(frame, 0, 0.01, 11).solve()
+        displacements.append(u)
+
+    np.testing.assert_allclose(displacements[1], displacements[0], atol=1E-9 * np.abs(displacements[0]).max())
+
+
+@pytest.mark.parametrize('solver', ['dense', 'sparse'])
+def test_modal_basis(recorder, solver):
+    '''
+    Test description: the sparse shift-invert modes match a dense
+    eigen solve, and integrating every mode reproduces the full solve.
+    '''
+    frame, _ = cantilever(solver)
+    free = frame.free
+    sim = Simulation(frame, 0, 0.01, 11, n_modes=6)
+    K, M = sim.K[free][:, free].toarray(), sim.M[free][:, free].toarray()
+    expected = sla.eigh(K, M, eigvals_only=True, subset_by_index=[0, 5])
+
+    np.testing.assert_allclose(sim.omega_sq, expected, rtol=1E-8)
+    np.testing.assert_allclose(sim.phi.T @ (sim.M @ sim.phi), np.eye(6), atol=1E-8)
+
+    t, u = Simulation(frame, 0, 0.01, 11).solve()
+    t_modal, u_modal = Simulation(frame, 0, 0.01, 11, n_modes=free.size).solve()
+    np.testing.assert_allclose(t_modal, t)
+    np.testing.assert_allclose(u_modal, u, atol=1E-3 * np.abs(u).max())
+
+
+@pytest.mark.parametrize('decimate', [1, 3])
+def test_write(tmp_path, decimate):
+    '''
+    Test description: the memory-mapped files hold every decimate-th
+    output time of solve() and can be loaded back.
+    '''
+    sim = Simulation(Solution(), 0, 0.01, 11)
+    t, u = sim.solve()
+
+    arrays = sim.write(tmp_path, chunk_size=2, decimate=decimate)
+    t_file = np.load(tmp_path / 't.npy')
+    u_file = np.load(tmp_path / 'u.npy')
+
+    assert isinstance(arrays['u'], np.memmap)
+    assert u_file.shape == (len(t[::decimate]), 2)
+    np.testing.assert_allclose(t_file, t[::decimate])
+    np.testing.assert_allclose(u_file, u[:, ::decimate].T, atol=1E-2 * np.abs(u).max())
+
+
+def test_parse_u(recorder):
+    '''
+    Test description: the vectorized deformed meshes match a
+    node by node loop, for one beam and for a list of beams.
+    '''
+    frame, beam = cantilever('sparse')
+    sim = Simulation(frame, 0, 0.01, 5)
+    t, u = sim.solve()
+
+    expected = np.zeros((beam.num_nodes, 3, len(t)))
+    for i in range(beam.num_nodes):
+        for j in range(len(t)):
+            expected[i, :, j] = beam.mesh.value[i] + u[beam.map[i]:beam.map[i] + 3, j]
+
+    np.testing.assert_allclose(sim.parse_u(u, beam), expected)
+    meshes = sim.parse_u(u, [beam])
+    assert list(meshes) == [beam.name]
+    np.testing.assert_allclose(meshes[beam.name], expected)
+
+
+def test_parallel_rendering(tmp_path):
+    '''
+    Test description: the frames rendered on several workers come back
+    in order and match the frames of a single worker.
+    '''
+    import imageio
+
+    sim = Simulation(Solution(), 0, 0.01, 6)
+    t = np.linspace(0, 1, 6)
+    mesh = np.zeros((4, 3, 6))
+    mesh[:, 1] = np.linspace(0, 3, 4)[:, None]
+    mesh[:, 2] = np.outer(np.linspace(0, 1, 4), t)
+
+    sim.create_frames([mesh], xlim=(-1, 4), ylim=(-1, 2), figsize=(3, 2), output_dir=tmp_path / 'img', workers=2)
+    assert sorted(path.name for path in (tmp_path / 'img').iterdir()) == sorted(f'img_{i}.png' for i in range(6))
+
+    for workers in (1, 2):
+        sim.animate(tmp_path / f'{workers}.gif', [mesh], fps=10, figsize=(3, 2), 
+                    xlim=(-1, 4), ylim=(-1, 2), workers=workers)
+    single = imageio.v2.mimread(tmp_path / '1.gif')
+    parallel = imageio.v2.mimread(tmp_path / '2.gif')
+
+    assert len(parallel) == 6
+    for a, b in zip(single, parallel):
+        np.testing.assert_array_equal(a, b)
+    # the frames differ, so the order is checked
+    assert not np.array_equal(parallel[0], parallel[-1])
@@ -0,0 +1,342 @@
+import pytest
+import numpy as np
+
+csdl = pytest.importorskip('csdl_alpha')
+import aframe as af
+from aframe.core.solvers import SparseSolve, BandedSolve, DenseSolve, FactorCache, ConjugateGradientSolve
+
+
+@pytest.fixture(autouse=True)
+def recorder():
+    recorder = csdl.Recorder(inline=True)
+    recorder.start()
+    yield recorder
+    recorder.stop()
+
+
+def banded_system(dim=24, bandwidth=5, seed=0):
+    '''
+    a symmetric positive definite banded matrix and its COO pattern
+    '''
+    rng = np.random.default_rng(seed)
+    K = rng.standard_normal((dim, dim))
+    K = K + K.T
+    K[np.abs(np.subtract.outer(np.arange(dim), np.arange(dim))) > bandwidth] = 0
+    K += 2 * np.abs(K).sum(axis=1).max() * np.eye(dim)
+    rows, cols = np.nonzero(K)
+
+    return K, rows, cols
+
+
+def check_derivatives(operation, input_vals, tangents, rng, h=1E-6):
+    '''
+    compare the jacobian products with central differences along the
+    tangents, and the transposed products with the dot product identity
+    '''
+    output_vals = {}
+    operation.compute(input_vals, output_vals)
+    derivatives = {}
+    operation.compute_derivatives(input_vals, output_vals, derivatives)
+
+    for name, tangent in tangents.items():
+        plus = {key: value + h * tangent if key == name else value for key, value in input_vals.items()}
+        minus = {key: value - h * tangent if key == name else value for key, value in input_vals.items()}
+        x_plus, x_minus = {}, {}
+        operation.compute(plus, x_plus)
+        operation.compute(minus, x_minus)
+        fd = (x_plus['x'] - x_minus['x']).ravel() / (2 * h)
+
+        J = derivatives['x', name]
+        np.testing.assert_allclose(J @ tangent.ravel(), fd, atol=1E-6 * np.abs(fd).max())
+
+        w = rng.standard_normal(fd.size)
+        np.testing.assert_allclose((J.T @ w) @ tangent.ravel(), w @ (J @ tangent.ravel()), rtol=1E-8)
+
+        # the full matrix agrees with the products
+        np.testing.assert_allclose(np.asarray(J) @ tangent.ravel(), J @ tangent.ravel(), atol=1E-10 * np.abs(fd).max())
+
+
+def linear_solve(solver, K, rows, cols, cache=None):
+    '''
+    the operation and its data input for a solver name
+    '''
+    if solver == 'dense':
+        return DenseSolve(K.shape[0], cache), K
+    elif solver == 'banded':
+        return BandedSolve(rows, cols, K.shape[0], cache), K[rows, cols]
+
+    return SparseSolve(rows, cols, K.shape[0], cache), K[rows, cols]
+
+
+@pytest.mark.parametrize('solver', ['sparse', 'banded', 'dense'])
+@pytest.mark.parametrize('n_cases', [None, 3])
+def test_linear_solve_derivatives(solver, n_cases):
+    '''
+    Test description: the adjoint derivatives of the factored solves
+    match finite differences, with and without load cases.
+    '''
+    rng = np.random.default_rng(1)
+    K, rows, cols = banded_system()
+    dim = K.shape[0]
+    shape = (dim,) if n_cases is None else (n_cases, dim)
+
+    # a symmetric perturbation, the banded solve only reads the lower triangle
+    dK = rng.standard_normal((dim, dim))
+    dK = (dK + dK.T) * (K != 0)
+
+    operation, data = linear_solve(solver, K, rows, cols)
+    _, data_tangent = linear_solve(solver, dK, rows, cols)
+
+    b = rng.standard_normal(shape)
+    input_vals = {'data': data, 'b': b}
+    output_vals = {}
+    operation.compute(input_vals, output_vals)
+    np.testing.assert_allclose(output_vals['x'], np.linalg.solve(K, b.T).T, rtol=1E-10)
+
+    check_derivatives(operation, input_vals, {'data': data_tangent, 'b': rng.standard_normal(shape)}, rng)
+
+
+@pytest.mark.parametrize('solver', ['sparse', 'banded', 'dense'])
+def test_factor_cache(solver):
+    '''
+    Test description: repeated solves and the derivatives reuse the
+    cached factorization, a new stiffness is factored again.
+    '''
+    K, rows, cols = banded_system()
+    cache = FactorCache(maxsize=1)
+    operation, data = linear_solve(solver, K, rows, cols, cache)
+    b = np.ones(K.shape[0])
+
+    output_vals = {}
+    operation.compute({'data': data, 'b': b}, output_vals)
+    operation.compute({'data': data, 'b': 2 * b}, {})
+    operation.compute_derivatives({'data': data, 'b': b}, output_vals, {})
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    operation.compute({'data': 2 * data, 'b': b}, {})
+    assert (cache.hits, cache.misses, len(cache)) == (2, 2, 1)
+
+
+def element_system(num_elements=5, seed=2):
+    '''
+    random symmetric positive definite element matrices on a chain,
+    the dofs of the first node are constrained
+    '''
+    rng = np.random.default_rng(seed)
+    dofs = [np.array([np.arange(6 * i, 6 * i + 12) for i in range(num_elements)])]
+    A = rng.standard_normal((num_elements, 12, 12))
+    k = A @ A.transpose(0, 2, 1) + 12 * np.eye(12)
+
+    return dofs, k, np.arange(6)
+
+
+@pytest.mark.parametrize('n_cases', [None, 2])
+def test_conjugate_gradient_derivatives(n_cases):
+    '''
+    Test description: the matrix-free solve matches a dense solve and its
+    adjoint derivatives match finite differences.
+    '''
+    rng = np.random.default_rng(2)
+    dofs, k, constrained = element_system()
+    dim = 6 * (k.shape[0] + 1)
+
+    operation = ConjugateGradientSolve(dofs, dim, constrained)
+    shape = (dim,) if n_cases is None else (n_cases, dim)
+    b = rng.standard_normal(shape)
+    b[..., constrained] = 0
+    input_vals = {'b': b, 'k0': k}
+
+    # the assembled system with a unit diagonal on the constrained dofs
+    K = np.zeros((dim, dim))
+    for element_dofs, matrix in zip(dofs[0], k):
+        K[np.ix_(element_dofs, element_dofs)] += matrix
+    K[constrained, :] = 0
+    K[:, constrained] = 0
+    K[constrained, constrained] = 1
+
+    output_vals = {}
+    operation.compute(input_vals, output_vals)
+    np.testing.assert_allclose(output_vals['x'], np.linalg.solve(K, b.T).T, atol=1E-8 * np.abs(output_vals['x']).max())
+    assert operation.info['converged']
+
+    dk = rng.standard_normal(k.shape)
+    check_derivatives(operation, input_vals, {'k0': dk + dk.transpose(0, 2, 1), 'b': rng.standard_normal(shape)}, rng)
+    assert operation.info['adjoint_iterations'] > 0
+    assert operation.info['adjoint_converged']
+
+
+def test_conjugate_gradient_not_converged():
+    '''
+    Test description: stopping at maxiter above the tolerance warns
+    and is recorded in info.
+    '''
+    dofs, k, constrained = element_system()
+    dim = 6 * (k.shape[0] + 1)
+    operation = ConjugateGradientSolve(dofs, dim, constrained, maxiter=3)
+    b = np.ones(dim)
+    b[constrained] = 0
+
+    output_vals = {}
+    with pytest.warns(RuntimeWarning, match='did not converge'):
+        operation.compute({'b': b, 'k0': k}, output_vals)
+    assert operation.info['iterations'] == 3
+    assert not operation.info['converged']
+
+    derivatives = {}
+    operation.compute_derivatives({'b': b, 'k0': k}, output_vals, derivatives)
+    with pytest.warns(RuntimeWarning, match='did not converge'):
+        derivatives['x', 'b'].T @ np.ones(dim)
+    assert not operation.info['adjoint_converged']
+
+
+def two_beams(**kwargs):
+    '''
+    two joined beams with pinned and fixed nodes
+    '''
+    aluminum = af.Material(name='aluminum', E=69E9, G=26E9, density=2700)
+    n = 11
+
+    mesh_1 = np.zeros((n, 3))
+    mesh_1[:, 1] = np.linspace(-10, 10, n)
+    mesh_2 = np.zeros((n, 3))
+    mesh_2[:, 0] = np.linspace(-10, 10, n)
+    mesh_2[:, 2] = np.linspace(0, 0.3, n)
+
+    beams = []
+    for name, mesh, radius in (('beam_1', mesh_1, 0.5), ('beam_2', mesh_2, 0.4)):
+        cs = af.CSTube(radius=csdl.Variable(value=np.ones(n - 1) * radius),
+                       thickness=csdl.Variable(value=np.ones(n - 1) * 0.002))
+        beams.append(af.Beam(name=name, mesh=csdl.Variable(value=mesh), material=aluminum, cs=cs))
+
+    beam_1, beam_2 = beams
+    loads = np.zeros((n, 6))
+    loads[:, 2] = 2E4
+    loads[:, 4] = 300
+    beam_1.fix(5)
+    beam_1.pin(0)
+    beam_1.add_load(csdl.Variable(value=loads))
+    beam_2.fix(0)
+    beam_2.add_inertial_mass(100., 3)
+
+    frame = af.Frame(**kwargs)
+    frame.add_beam(beam_1)
+    frame.add_beam(beam_2)
+    frame.add_joint(members=[beam_1, beam_2], nodes=[5, 5])
+    frame.add_acc(csdl.Variable(value=np.array([0, 0, -9.81, 0, 0, 0])))
+
+    return frame, beam_1, beam_2
+
+
+@pytest.mark.parametrize('kwargs', [dict(solver='sparse'),
+                                    dict(solver='banded'),
+                                    dict(cache_size=2),
+                                    dict(solver='cg'),
+                                    dict(reduced=True),
+                                    dict(solver='sparse', reduced=True)])
+def test_solver_agreement(kwargs):
+    '''
+    Test description: every solver mode gives the dense displacements.
+    '''
+    reference, _, _ = two_beams()
+    reference.solve()
+    frame, _, _ = two_beams(**kwargs)
+    frame.solve()
+
+    for name in ('beam_1', 'beam_2'):
+        expected = reference.displacement[name].value
+        np.testing.assert_allclose(frame.displacement[name].value, expected, atol=1E-7 * np.abs(expected).max())
+
+
+@pytest.mark.parametrize('solver', ['dense', 'sparse'])
+def test_load_cases(solver):
+    '''
+    Test description: every load case gives the displacements and
+    stresses of its own single case solve.
+    '''
+    cases = np.random.default_rng(3).standard_normal((3, 11, 6)) * 1E3
+
+    frame, _, beam_2 = two_beams(solver=solver)
+    beam_2.add_load_cases(csdl.Variable(value=cases))
+    frame.solve()
+    stress = frame.compute_stress()
+
+    for i, case in enumerate(cases):
+        single, _, beam = two_beams(solver=solver)
+        beam.add_load(csdl.Variable(value=case))
+        single.solve()
+        single_stress = single.compute_stress()
+
+        for name in ('beam_1', 'beam_2'):
+            expected = single.displacement[name].value
+            np.testing.assert_allclose(frame.displacement[name].value[i], expected, atol=1E-10 * np.abs(expected).max())
+            np.testing.assert_allclose(stress[name].value[i], single_stress[name].value, rtol=1E-8)
+
+
+@pytest.mark.parametrize('solver', ['dense', 'sparse', 'banded'])
+def test_prescribed_displacements(solver):
+    '''
+    Test description: the prescribed displacements are met and the
+    full and reduced systems agree.
+    '''
+    frames = []
+    for reduced in (False, True):
+        frame, _, beam_2 = two_beams(solver=solver, reduced=reduced)
+        beam_2.prescribe(10, np.array([0.01, 0, -0.02, 0, 0.001, 0]))
+        beam_2.prescribe(8, np.array([0, 0, -0.05]))
+        frame.solve()
+        frames.append(frame)
+
+        np.testing.assert_allclose(frame.displacement['beam_2'].value[8], [0, 0, -0.05], atol=1E-12)
+        np.testing.assert_allclose(frame.displacement['beam_2'].value[10], [0.01, 0, -0.02], atol=1E-12)
+
+    for name in ('beam_1', 'beam_2'):
+        expected = frames[0].displacement[name].value
+        np.testing.assert_allclose(frames[1].displacement[name].value, expected, atol=1E-9 * np.abs(expected).max())
+
+
+def cantilever(radius, **kwargs):
+    '''
+    a cantilever with a tip load and a csdl radius
+    '''
+    n = 11
+    mesh = np.zeros((n, 3))
+    mesh[:, 1] = np.linspace(0, 10, n)
+    aluminum = af.Material(name='aluminum', E=69E9, G=26E9, density=2700)
+    cs = af.CSTube(radius=radius, thickness=csdl.Variable(value=np.ones(n - 1) * 0.01))
+    beam = af.Beam(name='beam', mesh=csdl.Variable(value=mesh), material=aluminum, cs=cs)
+    beam.fix(0)
+    loads = np.zeros((n, 6))
+    loads[-1, 2] = 1E4
+    loads[-1, 0] = 2E3
+    beam.add_load(csdl.Variable(value=loads))
+
+    frame = af.Frame(**kwargs)
+    frame.add_beam(beam)
+    frame.solve()
+
+    return frame.displacement['beam']
+
+
+@pytest.mark.parametrize('kwargs', [dict(solver='sparse'),
+                                    dict(solver='banded'),
+                                    dict(cache_size=2),
+                                    dict(solver='sparse', cache_size=2),
+                                    dict(solver='cg')])
+def test_recorded_gradient(kwargs):
+    '''
+    Test description: csdl.derivative through Frame.solve gives the
+    finite difference gradient of the tip displacement with respect
+    to the radius, i.e. the recorder accepts the solver derivatives.
+    '''
+    values = np.linspace(0.3, 0.2, 10)
+    radius = csdl.Variable(value=values)
+    tip = csdl.sum(cantilever(radius, **kwargs)[10, :])
+    gradient = csdl.derivative(tip, radius).value.ravel()
+
+    h = 1E-6
+    for i in (0, 4, 9):
+        step = np.zeros(10)
+        step[i] = h
+        plus = cantilever(csdl.Variable(value=values + step), **kwargs).value[-1].sum()
+        minus = cantilever(csdl.Variable(value=values - step), **kwargs).value[-1].sum()
+        np.testing.assert_allclose(gradient[i], (plus - minus) / (2 * h), rtol=1E-5)